@@ -1,10 +1,19 @@
 import os
-import io
+import sys
+import json
 import cv2
 import time
 import threading
-from datetime import datetime
-from flask import Flask, Response, jsonify, request, send_file, stream_with_context
+from flask import Flask, Response, jsonify, request, stream_with_context
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+try:
+    from pyspng import encode as spng_encode  # pyspng-seunglab; the original pyspng only decodes
+except ImportError:
+    spng_encode = None  # fall back to cv2.imencode
 
 # Environment Variables
 HTTP_HOST = os.environ.get("HTTP_HOST", "0.0.0.0")
@@ -13,22 +22,99 @@ CAMERA_INDEX = int(os.environ.get("CAMERA_INDEX", "0"))  # USB camera index (def
 FRAME_WIDTH = int(os.environ.get("FRAME_WIDTH", "640"))
 FRAME_HEIGHT = int(os.environ.get("FRAME_HEIGHT", "480"))
 IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "jpeg").lower()  # jpeg or png
+FRAME_TIMEOUT = float(os.environ.get("FRAME_TIMEOUT", "5"))
+STREAM_JPEG_QUALITY = int(os.environ.get("STREAM_JPEG_QUALITY", "70"))  # captures stay at 95
+# Capture buffers the grabber rotates through; a published frame is overwritten this many frames later
+CAPTURE_BUFFERS = 2
+CAMERA_IDLE_TIMEOUT = float(os.environ.get("CAMERA_IDLE_TIMEOUT", "30"))  # seconds before an unused device is released
+# Prefer V4L2 on Linux so buffer size and pixel format requests reach the driver
+CAPTURE_BACKEND = cv2.CAP_V4L2 if sys.platform.startswith("linux") else cv2.CAP_ANY
+PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+PART_MID = b'\r\n\r\n'
+PART_TAIL = b'\r\n'
+# Captures are one-shot, so favour latency: fastest zlib level with run-length matching
+PNG_PARAMS = [int(cv2.IMWRITE_PNG_COMPRESSION), 1, int(cv2.IMWRITE_PNG_STRATEGY), cv2.IMWRITE_PNG_STRATEGY_RLE]
+
+# A single broker thread reads and encodes; keep OpenCV from fanning each call out to a worker pool
+cv2.setNumThreads(1)
 
 app = Flask(__name__)
+# Responses are read by programs, not people; skip sorting keys on every jsonify
+app.json.sort_keys = False
+
+# /camera/info never changes, so serialize it once instead of on every health-check poll
+CAMERA_INFO_JSON = json.dumps({
+    "device_name": "Logitech Camera",
+    "device_model": "Logitech Camera",
+    "manufacturer": "Logitech",
+    "device_type": "Camera",
+    "supported_formats": ["MJPEG", "YUYV", "H.264"],
+    "image_formats": ["JPEG", "PNG"],
+    "streaming_endpoint": "/stream/start (POST), /camera/stream/start (POST)",
+    "capture_endpoint": "/capture (POST), /camera/capture (POST)"
+}, separators=(",", ":")).encode()
+ROOT_INFO_JSON = json.dumps({
+    "message": "Logitech Camera Driver",
+    "endpoints": [
+        {"path": "/camera/info", "method": "GET", "description": "Camera information"},
+        {"path": "/camera/capture", "method": "POST", "description": "Capture image"},
+        {"path": "/capture", "method": "POST", "description": "Capture image"},
+        {"path": "/stream/start", "method": "POST", "description": "Start streaming"},
+        {"path": "/camera/stream/start", "method": "POST", "description": "Start streaming"},
+        {"path": "/stream/stop", "method": "POST", "description": "Stop streaming"},
+        {"path": "/camera/stream/stop", "method": "POST", "description": "Stop streaming"},
+        {"path": "/stream/video", "method": "GET", "description": "MJPEG video stream"}
+    ]
+}, separators=(",", ":")).encode()
+# Both bodies are constant for the life of the process, so pollers may reuse them
+STATIC_JSON_HEADERS = {"Cache-Control": "max-age=300"}
+
+def encode_jpeg(frame, quality):
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ret:
+        return None
+    return jpeg.tobytes()
+
+def encode_png(frame):
+    if spng_encode is not None:
+        # libspng's SIMD filters and CRC outrun libpng at the same level; it takes RGB order
+        return spng_encode(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), compress_level=1)
+    ret, buf = cv2.imencode('.png', frame, PNG_PARAMS)
+    return buf.tobytes() if ret else None
+
+def is_jpeg_buffer(frame):
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
 
 # Globals for streaming control
 streaming = False
 streaming_lock = threading.Lock()
 camera = None
+# Guards opening/releasing the device and starting or stopping its broker
+camera_lock = threading.Lock()
+camera_last_used = 0.0
+idle_reaper = None
 
 def initialize_camera():
     global camera
     if camera is None:
-        cam = cv2.VideoCapture(CAMERA_INDEX)
-        cam.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
-        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+        cam = cv2.VideoCapture(CAMERA_INDEX, CAPTURE_BACKEND)
         if not cam.isOpened():
             raise RuntimeError("Unable to open camera at index %d" % CAMERA_INDEX)
+        # Keep a single queued frame so reads never return a stale image
+        cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Set format first; UVC cameras pick the available sizes and rates per pixel format
+        cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cam.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+        if int(cam.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG'):
+            # Keep the camera's JPEG bytes as-is; the stream forwards them without decoding or re-encoding
+            cam.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        # Discard the first frames while the sensor settles
+        for _ in range(2):
+            cam.grab()
         camera = cam
     return camera
 
@@ -38,49 +124,199 @@ def release_camera():
         camera.release()
         camera = None
 
-def get_image(format='jpeg'):
+def use_camera():
+    # Caller holds camera_lock. Keeps the device and its broker warm between captures instead of
+    # reopening per request; one reaper thread releases both after CAMERA_IDLE_TIMEOUT unused
+    global camera_last_used, idle_reaper
     cam = initialize_camera()
-    ret, frame = cam.read()
-    if not ret:
+    camera_last_used = time.monotonic()
+    if idle_reaper is None:
+        idle_reaper = threading.Thread(target=reap_idle_camera, daemon=True)
+        idle_reaper.start()
+    return cam
+
+def reap_idle_camera():
+    global idle_reaper
+    while True:
+        with camera_lock:
+            idle = time.monotonic() - camera_last_used
+            if camera is not None and (streaming or idle < CAMERA_IDLE_TIMEOUT):
+                wait = CAMERA_IDLE_TIMEOUT if streaming else CAMERA_IDLE_TIMEOUT - idle
+            else:
+                frame_broker.stop()
+                release_camera()
+                idle_reaper = None
+                return
+        time.sleep(wait)
+
+# One grabber thread reads and encodes each frame once; every stream client waits for the newest JPEG
+class FrameBroker:
+    def __init__(self):
+        self.cond = threading.Condition()
+        # (frame_id, frame, jpeg) replaced wholesale by the grabber thread; readers take it without locking
+        self.latest = (0, None, None)
+        self.subscribers = 0  # open streams
+        self.waiters = 0  # one-shot readers waiting for the next frame
+        self.running = False
+        self.thread = None
+
+    def start(self, cam):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, args=(cam,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=FRAME_TIMEOUT)
+            self.thread = None
+
+    def _run(self, cam):
+        # Rotate the capture buffers: read into one the readers are done with so
+        # OpenCV can reuse it while the frame size stays the same
+        buffers = [None] * CAPTURE_BUFFERS
+        back = 0
+        while self.running:
+            if not cam.grab():
+                break
+            # Nobody is waiting for this frame: leave it undecoded and unencoded
+            if not (self.subscribers or self.waiters):
+                continue
+            ret, frame = cam.retrieve(buffers[back])
+            if not ret:
+                break
+            # Passthrough frames are already JPEG, so the stream allocates no decode or encode buffers
+            jpeg = frame.tobytes() if is_jpeg_buffer(frame) else encode_jpeg(frame, STREAM_JPEG_QUALITY)
+            if jpeg is None:
+                continue
+            buffers[back] = frame
+            self.latest = (self.latest[0] + 1, frame, jpeg)
+            with self.cond:
+                self.cond.notify_all()
+            back = (back + 1) % CAPTURE_BUFFERS
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def _wait_newer(self, last_id):
+        # Returns the first (frame_id, frame, jpeg) newer than last_id (None: the next frame), or None
+        latest = self.latest
+        if last_id is None:
+            last_id = latest[0]
+        elif latest[0] != last_id and self.running:
+            # A viewer that is behind the producer takes the frame without touching the lock
+            return latest
+        # Frames are only produced while someone is waiting or subscribed
+        with self.cond:
+            self.waiters += 1
+            try:
+                self.cond.wait_for(lambda: self.latest[0] != last_id or not self.running, FRAME_TIMEOUT)
+            finally:
+                self.waiters -= 1
+        latest = self.latest
+        if not self.running or latest[0] == last_id:
+            return None
+        return latest
+
+    def wait_for_frame(self, last_id=None):
+        # Returns (frame_id, jpeg) for the first frame newer than last_id (None: the next frame)
+        latest = self._wait_newer(last_id)
+        if latest is None:
+            return last_id, None
+        return latest[0], latest[2]
+
+    def apply_frame(self, fn):
+        # Returns fn(frame) for the next frame, or None. fn reads the grabber's buffer in place, which is
+        # refilled once CAPTURE_BUFFERS - 1 newer frames are published; if that happened before fn
+        # finished, its result may mix two frames, so fn runs again on a private copy
+        latest = self._wait_newer(None)
+        if latest is None:
+            return None
+        result = fn(latest[1])
+        if self.latest[0] - latest[0] < CAPTURE_BUFFERS - 1:
+            return result
+        return fn(self._copy_newest())
+
+    def _copy_newest(self):
+        # A copy is quick enough to finish within the rotation; retry it on the newest frame if not
+        while True:
+            latest = self.latest
+            frame = latest[1].copy()
+            if self.latest[0] - latest[0] < CAPTURE_BUFFERS - 1:
+                return frame
+
+frame_broker = FrameBroker()
+
+timestamp_cache = (None, "")
+
+def utc_timestamp(ns):
+    # Format the date/time part once per second; bursts of captures only append the fraction
+    global timestamp_cache
+    sec, frac = divmod(ns, 1_000_000_000)
+    cached_sec, prefix = timestamp_cache
+    if sec != cached_sec:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        timestamp_cache = (sec, prefix)
+    return "%s.%06dZ" % (prefix, frac // 1000)
+
+def encode_image(frame, format):
+    if format == 'jpeg':
+        return frame.tobytes() if is_jpeg_buffer(frame) else encode_jpeg(frame, 95)
+    if is_jpeg_buffer(frame):
+        frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+    return encode_png(frame)
+
+def get_image(format='jpeg'):
+    # Only the broker thread reads the device; a capture waits for its next frame, whether or not
+    # a stream is running, so captures never queue on a lock around read()
+    with camera_lock:
+        frame_broker.start(use_camera())
+    # Encoding reads the broker's buffer directly; no per-capture copy of the frame
+    img_bytes = frame_broker.apply_frame(lambda frame: encode_image(frame, format))
+    if img_bytes is None:
         raise RuntimeError("Failed to capture image from camera")
-    img_ext = '.jpg' if format == 'jpeg' else '.png'
-    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 95] if format == 'jpeg' else [int(cv2.IMWRITE_PNG_COMPRESSION), 3]
-    ret2, img = cv2.imencode(img_ext, frame, encode_param)
-    if not ret2:
-        raise RuntimeError("Failed to encode image")
-    return img.tobytes(), format
+    return img_bytes, format
 
 def mjpeg_stream_gen():
-    global streaming
-    cam = initialize_camera()
+    global camera_last_used
+    with camera_lock:
+        cam = use_camera()
+    frame_broker.start(cam)
+    frame_id = None
+    part_sep = b''
+    frame_broker.subscribe()
     try:
-        while True:
-            with streaming_lock:
-                if not streaming:
-                    break
-            ret, frame = cam.read()
-            if not ret:
-                continue
-            ret2, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            if not ret2:
-                continue
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+        # streaming is a plain flag; streaming_lock only orders the start/stop transitions
+        while streaming:
+            frame_id, jpeg = frame_broker.wait_for_frame(frame_id)
+            if jpeg is None:
+                break
+            # The previous part's CRLF rides on this header, so each frame is two writes
+            yield part_sep + PART_PREFIX + b'%d' % len(jpeg) + PART_MID
+            yield jpeg
+            part_sep = PART_TAIL
     finally:
-        pass  # Do not release camera here, may be reused
+        frame_broker.unsubscribe()
+        # The idle timeout runs from the end of the stream, not from when it was opened
+        with camera_lock:
+            camera_last_used = time.monotonic()
 
 @app.route('/camera/info', methods=['GET'])
 def camera_info():
-    return jsonify({
-        "device_name": "Logitech Camera",
-        "device_model": "Logitech Camera",
-        "manufacturer": "Logitech",
-        "device_type": "Camera",
-        "supported_formats": ["MJPEG", "YUYV", "H.264"],
-        "image_formats": ["JPEG", "PNG"],
-        "streaming_endpoint": "/stream/start (POST), /camera/stream/start (POST)",
-        "capture_endpoint": "/capture (POST), /camera/capture (POST)"
-    })
+    return Response(CAMERA_INFO_JSON, mimetype="application/json", headers=STATIC_JSON_HEADERS)
 
 @app.route('/camera/capture', methods=['POST'])
 @app.route('/capture', methods=['POST'])
@@ -88,23 +324,16 @@ def capture_image():
     try:
         fmt = request.args.get("format", IMAGE_FORMAT)
         img_bytes, fmt = get_image(fmt)
-        now = datetime.utcnow().isoformat() + "Z"
-        filename = f"capture_{int(time.time())}.{fmt}"
-        buf = io.BytesIO(img_bytes)
-        buf.seek(0)
-        return send_file(
-            buf,
-            mimetype=f"image/{fmt}",
-            as_attachment=True,
-            download_name=filename,
-            etag=now,
-            last_modified=time.time(),
-            add_etags=True,
-            conditional=True
-        ), 200, {
+        ns = time.time_ns()
+        now = utc_timestamp(ns)
+        filename = f"capture_{ns:020d}.{fmt}"
+        # Hand the encoded bytes straight to the response; no file wrapper or extra copy
+        return Response(img_bytes, mimetype=f"image/{fmt}", headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "ETag": f'"{now}"',
             "X-Image-Format": fmt,
             "X-Timestamp": now
-        }
+        })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -127,7 +356,7 @@ def stop_stream():
         if not streaming:
             return jsonify({"status": "not streaming"}), 200
         streaming = False
-    time.sleep(0.2)
+    frame_broker.stop()
     return jsonify({"status": "streaming stopped"}), 200
 
 @app.route('/stream/video', methods=['GET'])
@@ -137,27 +366,12 @@ def stream_video():
         if not streaming:
             return jsonify({"error": "stream not started. POST /stream/start first."}), 400
     return Response(stream_with_context(mjpeg_stream_gen()),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+                    mimetype='multipart/x-mixed-replace; boundary=frame',
+                    direct_passthrough=True)
 
 @app.route('/', methods=['GET'])
 def root():
-    return jsonify({
-        "message": "Logitech Camera Driver",
-        "endpoints": [
-            {"path": "/camera/info", "method": "GET", "description": "Camera information"},
-            {"path": "/camera/capture", "method": "POST", "description": "Capture image"},
-            {"path": "/capture", "method": "POST", "description": "Capture image"},
-            {"path": "/stream/start", "method": "POST", "description": "Start streaming"},
-            {"path": "/camera/stream/start", "method": "POST", "description": "Start streaming"},
-            {"path": "/stream/stop", "method": "POST", "description": "Stop streaming"},
-            {"path": "/camera/stream/stop", "method": "POST", "description": "Stop streaming"},
-            {"path": "/stream/video", "method": "GET", "description": "MJPEG video stream"}
-        ]
-    })
-
-@app.teardown_appcontext
-def cleanup(exception=None):
-    release_camera()
+    return Response(ROOT_INFO_JSON, mimetype="application/json", headers=STATIC_JSON_HEADERS)
 
 if __name__ == '__main__':
     app.run(host=HTTP_HOST, port=HTTP_PORT, threaded=True)
\ No newline at end of file
@@ -1,11 +1,47 @@
 import os
+import sys
 import cv2
-import threading
 import time
-from flask import Flask, Response, request, jsonify, send_file, make_response
-from io import BytesIO
+import threading
+import numpy as np
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.serving import WSGIRequestHandler
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420, TJSAMP_422
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+try:
+    from pyspng import encode as spng_encode  # pyspng-seunglab; the original pyspng only decodes
+except ImportError:
+    spng_encode = None  # fall back to cv2.imencode
+try:
+    import orjson
+except ImportError:
+    orjson = None  # fall back to Flask's stdlib json provider
+
+# Cameras already run on their own threads; keep OpenCV from spawning a pool inside every encode/resize
+cv2.setNumThreads(1)
+
 app = Flask(__name__)
 
+class BufferedRequestHandler(WSGIRequestHandler):
+    # The dev server writes each chunked-encoding piece (size line, data, CRLF) to the socket on its own
+    # and flushes after every yielded chunk; buffering the pieces turns each flush into a single send
+    wbufsize = 256 * 1024
+
+class ORJSONProvider(DefaultJSONProvider):
+    # orjson serializes straight to UTF-8 and is several times faster than the stdlib encoder
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
 # Configuration from environment variables
 HTTP_SERVER_HOST = os.environ.get('HTTP_SERVER_HOST', '0.0.0.0')
 HTTP_SERVER_PORT = int(os.environ.get('HTTP_SERVER_PORT', '5000'))
@@ -14,6 +50,163 @@ DEFAULT_WIDTH = int(os.environ.get('CAMERA_DEFAULT_WIDTH', '640'))
 DEFAULT_HEIGHT = int(os.environ.get('CAMERA_DEFAULT_HEIGHT', '480'))
 DEFAULT_FPS = int(os.environ.get('CAMERA_DEFAULT_FPS', '30'))
 DEFAULT_FORMAT = os.environ.get('CAMERA_DEFAULT_FORMAT', 'MJPG')
+FRAME_TIMEOUT = float(os.environ.get('CAMERA_FRAME_TIMEOUT', '5'))
+# Live viewers tolerate a lower quality than captures; it cuts encode time and bytes per frame
+STREAM_JPEG_QUALITY = int(os.environ.get('STREAM_JPEG_QUALITY', '70'))
+# Capture buffers the grabber rotates through; a published frame is overwritten this many frames later
+CAPTURE_BUFFERS = 3
+# Prefer V4L2 on Linux so buffer size and pixel format requests reach the driver
+CAPTURE_BACKEND = cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY
+
+PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+PART_MID = b'\r\n\r\n'
+PART_TAIL = b'\r\n'
+
+def encode_jpeg(frame, quality=95):
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ret:
+        return None
+    return buffer.tobytes()
+
+def encode_yuyv_jpeg(buf, width, height, quality=95, out=None):
+    # Split packed YUYV (Y0 U Y1 V) into planar 4:2:2 and let libjpeg-turbo compress it directly,
+    # skipping the YUYV -> BGR -> YCbCr round trip; out lets a caller reuse one planar buffer
+    size = width * height
+    if buf.size != size * 2:
+        return None
+    packed = buf.reshape(-1)
+    planes = np.empty(size * 2, np.uint8) if out is None else out
+    # Luma is every even byte: narrowing the buffer read as little-endian 16-bit words is one contiguous pass
+    np.copyto(planes[:size], packed.view('<u2'), casting='unsafe')
+    np.copyto(planes[size:size + size // 2], packed[1::4])
+    np.copyto(planes[size + size // 2:], packed[3::4])
+    return turbo_jpeg.encode_from_yuv(planes, height, width, quality=quality, jpeg_subsample=TJSAMP_422)
+
+def encode_png(frame):
+    if spng_encode is not None:
+        # libspng's SIMD filters and CRC outrun libpng at the same level; it takes RGB order
+        return spng_encode(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), compress_level=1)
+    ret, buf = cv2.imencode('.png', frame)
+    return buf.tobytes() if ret else None
+
+def is_jpeg_buffer(frame):
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
+
+# Single grabber thread per camera; clients wait for the newest frame instead of reading the device
+class FrameBroker:
+    def __init__(self, cap, yuyv_size=None):
+        self.cap = cap
+        self.yuyv_size = yuyv_size
+        self.cond = threading.Condition()
+        # (frame_id, frame, jpeg) replaced wholesale by the grabber; readers take it without locking
+        self.latest = (0, None, None)
+        self.subscribers = 0  # open streams
+        self.waiters = 0  # one-shot readers waiting for the next frame
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=FRAME_TIMEOUT)
+
+    def _run(self):
+        # Rotate the capture buffers: read into one the readers are done with so
+        # OpenCV can reuse it while the frame size stays the same
+        buffers = [None] * CAPTURE_BUFFERS
+        back = 0
+        # The encoder copies the planes out, so one scratch buffer serves every YUYV frame
+        planes = np.empty(self.yuyv_size[0] * self.yuyv_size[1] * 2, np.uint8) if self.yuyv_size else None
+        while self.running:
+            if not self.cap.grab():
+                break
+            # Nobody is waiting for this frame: leave it undecoded and unencoded
+            if not (self.subscribers or self.waiters):
+                continue
+            ret, frame = self.cap.retrieve(buffers[back])
+            if not ret:
+                break
+            if self.yuyv_size is not None:
+                jpg_bytes = encode_yuyv_jpeg(frame, *self.yuyv_size, STREAM_JPEG_QUALITY, out=planes)
+            elif is_jpeg_buffer(frame):
+                jpg_bytes = frame.tobytes()
+            else:
+                jpg_bytes = encode_jpeg(frame, STREAM_JPEG_QUALITY)
+            if jpg_bytes is None:
+                continue
+            buffers[back] = frame
+            self.latest = (self.latest[0] + 1, frame, jpg_bytes)
+            with self.cond:
+                self.cond.notify_all()
+            back = (back + 1) % CAPTURE_BUFFERS
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def _wait_newer(self, last_id):
+        # Returns the first (frame_id, frame, jpeg) newer than last_id (None: the next frame), or None
+        latest = self.latest
+        if last_id is None:
+            last_id = latest[0]
+        elif latest[0] != last_id and self.running:
+            # A viewer that is behind the grabber takes the frame without touching the lock
+            return latest
+        # Frames are only produced while someone is waiting or subscribed
+        with self.cond:
+            self.waiters += 1
+            try:
+                self.cond.wait_for(lambda: self.latest[0] != last_id or not self.running, FRAME_TIMEOUT)
+            finally:
+                self.waiters -= 1
+        latest = self.latest
+        if not self.running or latest[0] == last_id:
+            return None
+        return latest
+
+    def wait_for_frame(self, last_id=None):
+        # Returns (frame_id, jpeg) for the first frame newer than last_id (None: the next frame)
+        latest = self._wait_newer(last_id)
+        if latest is None:
+            return last_id, None
+        return latest[0], latest[2]
+
+    def apply_frame(self, fn):
+        # Returns fn(frame) for the next frame, or None. fn reads the grabber's buffer in place, which is
+        # refilled once CAPTURE_BUFFERS - 1 newer frames are published; if that happened before fn
+        # finished, its result may mix two frames, so fn runs again on a private copy
+        latest = self._wait_newer(None)
+        if latest is None:
+            return None
+        result = fn(latest[1])
+        if self.latest[0] - latest[0] < CAPTURE_BUFFERS - 1:
+            return result
+        return fn(self._copy_newest())
+
+    def _copy_newest(self):
+        # A copy is quick enough to finish within the rotation; retry it on the newest frame if not
+        while True:
+            latest = self.latest
+            frame = latest[1].copy()
+            if self.latest[0] - latest[0] < CAPTURE_BUFFERS - 1:
+                return frame
 
 # Camera Manager to handle multiple cameras
 class CameraInstance:
@@ -25,40 +218,91 @@ class CameraInstance:
         self.format_ = format_
         self.lock = threading.Lock()
         self.running = False
+        self.passthrough = False
+        self.yuyv_size = None
+        self.last_capture = None  # (monotonic time, ext, image bytes, etag)
         self.cap = None
+        self.broker = None
 
     def start(self):
         with self.lock:
             if self.running:
                 return False, "Camera already running"
-            self.cap = cv2.VideoCapture(self.camera_id)
+            self.cap = cv2.VideoCapture(self.camera_id, CAPTURE_BACKEND)
             if not self.cap.isOpened():
                 return False, "Cannot open camera with id {}".format(self.camera_id)
+            # Keep a single queued frame so reads never return a stale image
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            # Set format first; UVC cameras pick the available sizes and rates per pixel format
+            fmt = self.format_.upper()
+            if fmt == "MJPG":
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            elif fmt == "YUYV" and turbo_jpeg is not None:
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
             # Set camera parameters
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
             self.cap.set(cv2.CAP_PROP_FPS, self.fps)
-            # Set format if supported
-            if self.format_.upper() == "MJPG":
-                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            if fmt == "MJPG":
+                # Keep the camera's JPEG bytes as-is instead of decoding them to BGR; only a camera that
+                # agreed to MJPG hands back JPEG, one that fell back to YUYV still needs converting
+                mjpg = cv2.VideoWriter_fourcc(*'MJPG')
+                if int(self.cap.get(cv2.CAP_PROP_FOURCC)) == mjpg:
+                    self.passthrough = bool(self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+            elif fmt == "YUYV" and turbo_jpeg is not None:
+                # Take the raw YUYV buffer and encode it from YUV planes instead of via BGR
+                yuyv = cv2.VideoWriter_fourcc(*'YUYV')
+                if int(self.cap.get(cv2.CAP_PROP_FOURCC)) == yuyv and self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+                    self.yuyv_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                      int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            # Discard the first frames while the sensor settles
+            for _ in range(2):
+                self.cap.grab()
+            self.broker = FrameBroker(self.cap, self.yuyv_size)
+            self.broker.start()
             self.running = True
             return True, "Camera started"
 
     def stop(self):
         with self.lock:
+            if self.broker is not None:
+                self.broker.stop()
+                self.broker = None
             if self.cap is not None:
                 self.cap.release()
                 self.cap = None
             self.running = False
 
+    def _decode(self, frame):
+        # Every branch returns a new array, so callers never hold on to the broker's buffer
+        if self.yuyv_size is not None:
+            width, height = self.yuyv_size
+            return cv2.cvtColor(frame.reshape(height, width, 2), cv2.COLOR_YUV2BGR_YUYV)
+        if is_jpeg_buffer(frame):
+            return cv2.imdecode(frame, cv2.IMREAD_COLOR)
+        return frame.copy()
+
     def read_frame(self):
-        with self.lock:
-            if not self.running or self.cap is None:
-                return None
-            ret, frame = self.cap.read()
-            if not ret:
-                return None
-            return frame
+        # Only the broker thread touches cap; readers take the newest published frame
+        broker = self.broker
+        if broker is None:
+            return None
+        return broker.apply_frame(self._decode)
+
+    def read_jpeg(self):
+        broker = self.broker
+        if broker is None:
+            return None
+        if self.passthrough:
+            # The published bytes are the camera's own JPEG
+            _, jpg_bytes = broker.wait_for_frame()
+            return jpg_bytes
+        # Published JPEGs are stream quality; captures get a full-quality encode
+        # Encoders only read their input, so they work on the broker's buffer without a copy
+        if self.yuyv_size is not None:
+            return broker.apply_frame(lambda frame: encode_yuyv_jpeg(frame, *self.yuyv_size))
+        return broker.apply_frame(
+            lambda frame: encode_jpeg(cv2.imdecode(frame, cv2.IMREAD_COLOR) if is_jpeg_buffer(frame) else frame))
 
     def is_running(self):
         with self.lock:
@@ -127,19 +371,23 @@ def stop_camera():
 
 def gen_frames(camera_id):
     cam = camera_manager.get_camera(camera_id)
-    if not cam:
+    if not cam or cam.broker is None:
         return
-    while True:
-        frame = cam.read_frame()
-        if frame is None:
-            break
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
-            continue
-        jpg_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + jpg_bytes + b'\r\n')
-        time.sleep(1.0 / cam.fps if cam.fps > 0 else 0.03)
+    broker = cam.broker
+    frame_id = None
+    part_sep = b''
+    broker.subscribe()
+    try:
+        while True:
+            frame_id, jpg_bytes = broker.wait_for_frame(frame_id)
+            if jpg_bytes is None:
+                break
+            # The previous part's CRLF rides on this header, so each frame is two writes
+            yield part_sep + PART_PREFIX + b'%d' % len(jpg_bytes) + PART_MID
+            yield jpg_bytes
+            part_sep = PART_TAIL
+    finally:
+        broker.unsubscribe()
 
 @app.route('/camera/stream', methods=['GET'])
 def stream_camera():
@@ -149,7 +397,8 @@ def stream_camera():
         if not cam:
             return jsonify({"status": "error", "message": "Camera with id {} is not running".format(camera_id)}), 400
         return Response(gen_frames(camera_id),
-                        mimetype='multipart/x-mixed-replace; boundary=frame')
+                        mimetype='multipart/x-mixed-replace; boundary=frame',
+                        direct_passthrough=True)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -161,28 +410,35 @@ def capture_frame():
         cam = camera_manager.get_camera(camera_id)
         if not cam:
             return jsonify({"status": "error", "message": "Camera with id {} is not running".format(camera_id)}), 400
-        frame = cam.read_frame()
-        if frame is None:
-            return jsonify({"status": "error", "message": "Failed to capture frame"}), 500
         # Supported formats: jpg, png
         ext = '.jpg' if image_format not in ['png', 'jpeg'] else '.' + image_format
-        ret, buffer = cv2.imencode(ext, frame)
-        if not ret:
-            return jsonify({"status": "error", "message": "Failed to encode image"}), 500
-        img_bytes = buffer.tobytes()
-        img_io = BytesIO(img_bytes)
-        img_io.seek(0)
+        cached = cam.last_capture
+        # Clients polling faster than the camera's frame interval get the previous capture back
+        if cached is not None and cached[1] == ext and cam.fps and time.monotonic() - cached[0] < 1.0 / cam.fps:
+            _, _, img_bytes, etag = cached
+        else:
+            if ext == '.png':
+                frame = cam.read_frame()
+                if frame is None:
+                    return jsonify({"status": "error", "message": "Failed to capture frame"}), 500
+                img_bytes = encode_png(frame)
+                if img_bytes is None:
+                    return jsonify({"status": "error", "message": "Failed to encode image"}), 500
+            else:
+                img_bytes = cam.read_jpeg()
+                if img_bytes is None:
+                    return jsonify({"status": "error", "message": "Failed to capture frame"}), 500
+            etag = '{}-{:x}'.format(camera_id, time.time_ns())
+            cam.last_capture = (time.monotonic(), ext, img_bytes, etag)
         mimetype = 'image/jpeg' if ext in ['.jpg', '.jpeg'] else 'image/png'
-        response = make_response(send_file(
-            img_io,
-            mimetype=mimetype,
-            as_attachment=True,
-            download_name='capture{}'.format(ext)
-        ))
-        response.headers['Content-Disposition'] = f'attachment; filename=capture{ext}'
-        return response
+        # Hand the encoded bytes straight to the response; no file wrapper or extra copy
+        response = Response(img_bytes, mimetype=mimetype,
+                            headers={'Content-Disposition': f'attachment; filename=capture{ext}'})
+        response.set_etag(etag)
+        # Answers a matching If-None-Match with 304 instead of resending the image
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 # Run python app
 if __name__ == '__main__':
-    app.run(host=HTTP_SERVER_HOST, port=HTTP_SERVER_PORT, threaded=True)
\ No newline at end of file
+    app.run(host=HTTP_SERVER_HOST, port=HTTP_SERVER_PORT, threaded=True, request_handler=BufferedRequestHandler)
\ No newline at end of file
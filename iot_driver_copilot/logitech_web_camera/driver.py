@@ -1,33 +1,170 @@
 import os
+import sys
+import asyncio
 import threading
 import cv2
-import time
-import io
-from flask import Flask, Response, request, jsonify, send_file
-from werkzeug.exceptions import BadRequest
+from aiohttp import web
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # the default asyncio loop works, just with more per-write overhead
 
-app = Flask(__name__)
+# Grabber and capture threads encode on their own; an OpenCV pool per call would oversubscribe the CPUs
+cv2.setNumThreads(1)
 
 # Environment variables for server configuration
 HTTP_HOST = os.getenv('HTTP_HOST', '0.0.0.0')
 HTTP_PORT = int(os.getenv('HTTP_PORT', '8080'))
+# Stream frames are encoded below capture quality; live viewers rarely notice and it halves encode work
+STREAM_JPEG_QUALITY = int(os.getenv('STREAM_JPEG_QUALITY', '70'))
+FRAME_TIMEOUT = float(os.getenv('FRAME_TIMEOUT', '5'))
+# Capture buffers the grabber rotates through; a published frame is overwritten this many frames later
+CAPTURE_BUFFERS = 3
+# Prefer V4L2 on Linux so pixel format requests reach the driver
+CAPTURE_BACKEND = cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY
+PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+PART_MID = b'\r\n\r\n'
+PART_TAIL = b'\r\n'
+
+def encode_jpeg(frame, quality=95):
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ret:
+        return None
+    return buffer.tobytes()
+
+def is_jpeg_buffer(frame):
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
+
+# One capture thread per camera reads each frame and encodes it once for every stream client;
+# clients only wait for the newest JPEG and send it, so a slow socket never delays the next read.
+# Clients are coroutines on the server's event loop, so N streams cost N tasks rather than N threads
+class FrameGrabber:
+    def __init__(self, cap, loop):
+        self.cap = cap
+        self.loop = loop
+        # Replaced on every frame; the old event is set to wake all clients waiting on it
+        self.frame_ready = asyncio.Event()
+        # (frame_id, frame, jpeg) swapped as one reference so readers never see a torn tuple
+        self.latest = (0, None, None)
+        # Both counts are only touched on the event loop
+        self.subscribers = 0  # open streams; the stream JPEG is only encoded while there are any
+        self.waiters = 0  # captures waiting for the next frame
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.loop.call_soon_threadsafe(self._notify)
+        if self.thread is not None:
+            self.thread.join(FRAME_TIMEOUT)
+            self.thread = None
+
+    def _run(self):
+        # Retrieve into rotating buffers so OpenCV reuses their memory while the frame size stays the same
+        buffers = [None] * CAPTURE_BUFFERS
+        back = 0
+        while self.running:
+            if not self.cap.grab():
+                break
+            # Nobody is waiting for this frame: leave it undecoded and unencoded
+            if not (self.subscribers or self.waiters):
+                continue
+            ret, frame = self.cap.retrieve(buffers[back])
+            if not ret or frame is None:
+                break
+            jpeg = None
+            if self.subscribers:
+                # Passthrough frames are already JPEG; anything else is encoded once for all viewers
+                jpeg = frame.tobytes() if is_jpeg_buffer(frame) else encode_jpeg(frame, STREAM_JPEG_QUALITY)
+            buffers[back] = frame
+            self.latest = (self.latest[0] + 1, frame, jpeg)
+            self.loop.call_soon_threadsafe(self._notify)
+            back = (back + 1) % CAPTURE_BUFFERS
+        self.running = False
+        self.loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self):
+        # Runs on the event loop thread, so swapping the event cannot race a client picking it up
+        event, self.frame_ready = self.frame_ready, asyncio.Event()
+        event.set()
+
+    async def wait_for_frame(self, last_id=None):
+        # Returns (frame_id, frame, jpeg) for the first frame newer than last_id (None: the next frame);
+        # frame is None once the camera stops or no frame arrives within FRAME_TIMEOUT, and jpeg is
+        # None for frames grabbed while no stream was subscribed
+        if last_id is None:
+            last_id = self.latest[0]
+        event = self.frame_ready
+        latest = self.latest
+        if latest[0] == last_id and self.running:
+            # Frames are only retrieved while someone is waiting or subscribed
+            self.waiters += 1
+            try:
+                await asyncio.wait_for(event.wait(), FRAME_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiters -= 1
+            latest = self.latest
+        if not self.running or latest[0] == last_id:
+            return last_id, None, None
+        return latest
+
+    def apply_frame(self, fn, frame_id, frame):
+        # Returns fn(frame) for a frame from wait_for_frame. fn reads the grabber's buffer in place, which
+        # is refilled once CAPTURE_BUFFERS - 1 newer frames are published; if that happened before fn
+        # finished, its result may mix two frames, so fn runs again on a private copy
+        result = fn(frame)
+        if self.latest[0] - frame_id < CAPTURE_BUFFERS - 1:
+            return result
+        return fn(self._copy_newest())
+
+    def _copy_newest(self):
+        # A copy is quick enough to finish within the rotation; retry it on the newest frame if not
+        while True:
+            latest = self.latest
+            frame = latest[1].copy()
+            if self.latest[0] - latest[0] < CAPTURE_BUFFERS - 1:
+                return frame
 
 # Thread-safe camera manager
 class CameraManager:
     def __init__(self):
-        self.cameras = {}  # camera_id: { 'cap': cv2.VideoCapture, 'lock': threading.Lock(), 'params': { ... } }
-        self.locks = {}    # camera_id: threading.Lock
+        self.cameras = {}  # camera_id: { 'cap': cv2.VideoCapture, 'grabber': FrameGrabber, 'params': { ... } }
+        self.loop = None  # the server's event loop, set on startup
 
     def start_camera(self, camera_id=0, width=640, height=480, fps=None, fmt=None):
         camera_id = int(camera_id)
         if camera_id in self.cameras:
             return {'status': 'already_started'}
 
-        lock = threading.Lock()
-        cap = cv2.VideoCapture(camera_id)
+        cap = cv2.VideoCapture(camera_id, CAPTURE_BACKEND)
         if not cap.isOpened():
             return {'error': f'Failed to open camera {camera_id}.'}
 
+        # Set format first (OpenCV supports some fourcc formats); UVC cameras list sizes per pixel format.
+        # Without a requested format, ask for the MJPG Logitech cameras emit natively
+        try:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*(fmt or 'MJPG')))
+        except Exception:
+            pass  # Ignore if format is invalid
+        if int(cap.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG'):
+            # Keep the camera's JPEG bytes as-is so they are forwarded without a decode/re-encode round trip
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
         # Set resolution
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
@@ -36,29 +173,24 @@ class CameraManager:
         if fps:
             cap.set(cv2.CAP_PROP_FPS, float(fps))
 
-        # Set format if provided (OpenCV supports some fourcc formats)
-        if fmt:
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*fmt)
-                cap.set(cv2.CAP_PROP_FOURCC, fourcc)
-            except Exception:
-                pass  # Ignore if format is invalid
+        # Keep a single queued frame so a slow consumer gets the newest image, not a backlog
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
-        self.cameras[camera_id] = {'cap': cap, 'lock': lock, 'params': {
+        grabber = FrameGrabber(cap, self.loop)
+        grabber.start()
+        self.cameras[camera_id] = {'cap': cap, 'grabber': grabber, 'params': {
             'width': width, 'height': height, 'fps': fps, 'format': fmt
         }}
-        self.locks[camera_id] = lock
         return {'status': 'started', 'camera_id': camera_id, 'resolution': [width, height], 'fps': fps, 'format': fmt}
 
     def stop_camera(self, camera_id=0):
         camera_id = int(camera_id)
-        if camera_id not in self.cameras:
+        # Unpublish first so new requests miss the camera; the grabber is the only reader of cap
+        camera = self.cameras.pop(camera_id, None)
+        if camera is None:
             return {'error': f'Camera {camera_id} is not active.'}
-        with self.locks[camera_id]:
-            cap = self.cameras[camera_id]['cap']
-            cap.release()
-            del self.cameras[camera_id]
-            del self.locks[camera_id]
+        camera['grabber'].stop()
+        camera['cap'].release()
         return {'status': 'stopped', 'camera_id': camera_id}
 
     def get_camera(self, camera_id=0):
@@ -74,77 +206,101 @@ class CameraManager:
         return self.cameras[camera_id]['params'] if camera_id in self.cameras else {}
 
 camera_manager = CameraManager()
+routes = web.RouteTableDef()
 
-# Capture frame endpoint
-@app.route('/cameras/capture', methods=['GET'])
-def capture_frame():
-    camera_id = int(request.args.get('camera_id', 0))
+def capture_jpeg(frame):
+    # Passthrough frames are already JPEG; anything else is encoded straight from the grabber's buffer
+    return frame.tobytes() if is_jpeg_buffer(frame) else encode_jpeg(frame)
 
-    if not camera_manager.is_active(camera_id):
-        return jsonify({'error': f'Camera {camera_id} is not active. Please start the camera first.'}), 400
+async def read_json(request):
+    if request.content_type != 'application/json':
+        return {}
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return None
 
-    camera = camera_manager.get_camera(camera_id)
-    lock = camera['lock']
-    cap = camera['cap']
-
-    with lock:
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            return jsonify({'error': f'Failed to capture frame from camera {camera_id}.'}), 500
-        # Encode as JPEG
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
-            return jsonify({'error': 'Failed to encode image.'}), 500
-        img_bytes = buffer.tobytes()
-
-    return send_file(
-        io.BytesIO(img_bytes),
-        mimetype='image/jpeg',
-        as_attachment=True,
-        download_name=f'camera_{camera_id}_frame.jpg'
-    )
+# Capture frame endpoint
+@routes.get('/cameras/capture')
+async def capture_frame(request):
+    camera_id = int(request.query.get('camera_id', 0))
 
-# Stream video endpoint
-def generate_stream(camera_id):
     camera = camera_manager.get_camera(camera_id)
     if camera is None:
-        return
-    cap = camera['cap']
-    lock = camera['lock']
+        return web.json_response({'error': f'Camera {camera_id} is not active. Please start the camera first.'}, status=400)
 
-    while True:
-        with lock:
-            ret, frame = cap.read()
-            if not ret or frame is None:
-                # End stream if error
-                break
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if not ret:
-                break
-            img_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + img_bytes + b'\r\n')
-        time.sleep(0.04)  # ~25 FPS default
+    # Wait for the next frame from the capture thread so the image is current
+    grabber = camera['grabber']
+    frame_id, frame, _ = await grabber.wait_for_frame()
+    img_bytes = None
+    if frame is not None:
+        # Encoding holds the CPU for milliseconds; keep it off the loop so streams keep flowing
+        img_bytes = await camera_manager.loop.run_in_executor(None, grabber.apply_frame, capture_jpeg, frame_id, frame)
+    if img_bytes is None:
+        return web.json_response({'error': f'Failed to capture frame from camera {camera_id}.'}, status=500)
+
+    return web.Response(body=img_bytes, content_type='image/jpeg', headers={
+        'Content-Disposition': f'attachment; filename=camera_{camera_id}_frame.jpg'
+    })
+
+# Stream video endpoint
+@routes.get('/cameras/stream')
+async def stream_camera(request):
+    camera_id = int(request.query.get('camera_id', 0))
 
-@app.route('/cameras/stream', methods=['GET'])
-def stream_camera():
-    camera_id = int(request.args.get('camera_id', 0))
+    camera = camera_manager.get_camera(camera_id)
+    if camera is None:
+        return web.json_response({'error': f'Camera {camera_id} is not active. Please start the camera first.'}, status=400)
+    grabber = camera['grabber']
 
-    if not camera_manager.is_active(camera_id):
-        return jsonify({'error': f'Camera {camera_id} is not active. Please start the camera first.'}), 400
+    # Optional per-client cap below the camera rate, e.g. for a viewer on a slow link
+    fps = request.query.get('fps')
+    if fps is not None:
+        try:
+            fps = float(fps)
+        except ValueError:
+            return web.json_response({'error': 'Invalid fps value'}, status=400)
+    interval = 1.0 / fps if fps and fps > 0 else 0.0
 
-    return Response(
-        generate_stream(camera_id),
-        mimetype='multipart/x-mixed-replace; boundary=frame'
-    )
+    response = web.StreamResponse(headers={'Content-Type': 'multipart/x-mixed-replace; boundary=frame'})
+    await response.prepare(request)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() - interval  # the first frame goes out right away
+    frame_id = None
+    part_sep = b''
+    grabber.subscribers += 1
+    try:
+        while True:
+            if interval:
+                # Sleep to the next slot instead of a fixed interval, so encode and send time is not added
+                # on top; a client that fell behind restarts from now rather than bursting to catch up
+                deadline = max(deadline + interval, loop.time())
+                await asyncio.sleep(deadline - loop.time())
+            # Frames that arrived while this client was sending are skipped, not queued
+            frame_id, frame, img_bytes = await grabber.wait_for_frame(frame_id)
+            if frame is None:
+                # End stream if error (including the camera being stopped)
+                break
+            if img_bytes is None:
+                # Retrieved just before this stream subscribed; the next frame comes encoded
+                continue
+            # Each write waits only for this client's socket; the previous part's CRLF rides on this
+            # header, so the JPEG itself is written without a concat copy
+            await response.write(part_sep + PART_PREFIX + b'%d' % len(img_bytes) + PART_MID)
+            await response.write(img_bytes)
+            part_sep = PART_TAIL
+    except ConnectionResetError:
+        pass  # the client went away mid-write; nothing left to send
+    finally:
+        grabber.subscribers -= 1
+    return response
 
 # Start camera endpoint
-@app.route('/cameras/start', methods=['POST'])
-def start_camera():
-    if request.is_json:
-        data = request.get_json()
-    else:
-        data = {}
+@routes.post('/cameras/start')
+async def start_camera(request):
+    data = await read_json(request)
+    if data is None:
+        return web.json_response({'error': 'Invalid JSON body'}, status=400)
 
     camera_id = int(data.get('camera_id', 0))
     width = int(data.get('width', 640))
@@ -156,29 +312,48 @@ def start_camera():
         try:
             fps = float(fps)
         except Exception:
-            return jsonify({'error': 'Invalid fps value'}), 400
+            return web.json_response({'error': 'Invalid fps value'}, status=400)
 
-    result = camera_manager.start_camera(camera_id, width, height, fps, fmt)
+    # Opening a device blocks for a while; keep it off the loop that serves the streams
+    result = await camera_manager.loop.run_in_executor(
+        None, camera_manager.start_camera, camera_id, width, height, fps, fmt)
     if 'error' in result:
-        return jsonify(result), 400
-    return jsonify(result)
+        return web.json_response(result, status=400)
+    return web.json_response(result)
 
 # Stop camera endpoint
-@app.route('/cameras/stop', methods=['POST'])
-def stop_camera():
-    if request.is_json:
-        data = request.get_json()
-    else:
-        data = {}
+@routes.post('/cameras/stop')
+async def stop_camera(request):
+    data = await read_json(request)
+    if data is None:
+        return web.json_response({'error': 'Invalid JSON body'}, status=400)
     camera_id = int(data.get('camera_id', 0))
-    result = camera_manager.stop_camera(camera_id)
+    # Stopping joins the grabber thread; wait for it on a worker, not on the loop
+    result = await camera_manager.loop.run_in_executor(None, camera_manager.stop_camera, camera_id)
     if 'error' in result:
-        return jsonify(result), 400
-    return jsonify(result)
+        return web.json_response(result, status=400)
+    return web.json_response(result)
+
+@web.middleware
+async def not_found(request, handler):
+    try:
+        return await handler(request)
+    except web.HTTPNotFound:
+        return web.json_response({'error': 'Endpoint not found'}, status=404)
+
+async def bind_loop(app):
+    camera_manager.loop = asyncio.get_running_loop()
+
+async def stop_cameras(app):
+    for camera_id in list(camera_manager.cameras):
+        await camera_manager.loop.run_in_executor(None, camera_manager.stop_camera, camera_id)
 
-@app.errorhandler(404)
-def not_found(e):
-    return jsonify({'error': 'Endpoint not found'}), 404
+app = web.Application(middlewares=[not_found])
+app.add_routes(routes)
+app.on_startup.append(bind_loop)
+app.on_cleanup.append(stop_cameras)
 
 if __name__ == '__main__':
-    app.run(host=HTTP_HOST, port=HTTP_PORT, threaded=True)
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.install()
+    web.run_app(app, host=HTTP_HOST, port=HTTP_PORT)
@@ -3,7 +3,6 @@ import asyncio
 import logging
 import yaml
 import json
-import signal
 from typing import Dict, Any
 
 import aiohttp
@@ -14,6 +13,12 @@ from kubernetes.config import ConfigException
 
 from asyncio_mqtt import Client as MQTTClient, MqttError
 
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads  # also takes the raw payload bytes, just slower
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("DeviceShifu-RobotDog")
@@ -26,6 +31,8 @@ PHASE_UNKNOWN = "Unknown"
 
 # MQTT message structure
 ALLOWED_COMMANDS = {'forward', 'backward', 'start', 'stop'}
+# Serialized once; every request for a command publishes the same bytes
+COMMAND_PAYLOADS = {command: json.dumps({"command": command}).encode() for command in ALLOWED_COMMANDS}
 
 # Read environment variables
 EDGEDEVICE_NAME = os.environ.get("EDGEDEVICE_NAME")
@@ -59,13 +66,15 @@ def get_k8s_api():
     return client.CustomObjectsApi()
 
 # EdgeDevice CRD interaction
-async def update_edgedevice_phase(api, phase: str):
+async def update_edgedevice_phase(api, phase: str) -> bool:
     body = {"status": {"edgeDevicePhase": phase}}
     group = "shifu.edgenesis.io"
     version = "v1alpha1"
     plural = "edgedevices"
     try:
-        api.patch_namespaced_custom_object_status(
+        # The client blocks on the apiserver round trip; keep it off the loop serving HTTP and MQTT
+        await asyncio.to_thread(
+            api.patch_namespaced_custom_object_status,
             group=group,
             version=version,
             namespace=EDGEDEVICE_NAMESPACE,
@@ -74,15 +83,18 @@ async def update_edgedevice_phase(api, phase: str):
             body=body
         )
         logger.info(f"EdgeDevice status phase set to {phase}")
+        return True
     except ApiException as e:
         logger.error(f"Failed to update EdgeDevice status: {e}")
+        return False
 
 async def get_edgedevice(api) -> Dict[str, Any]:
     group = "shifu.edgenesis.io"
     version = "v1alpha1"
     plural = "edgedevices"
     try:
-        obj = api.get_namespaced_custom_object(
+        obj = await asyncio.to_thread(
+            api.get_namespaced_custom_object,
             group=group,
             version=version,
             namespace=EDGEDEVICE_NAMESPACE,
@@ -114,9 +126,14 @@ class RobotDogDeviceShifu:
         self.settings = load_instruction_settings()
         self.mqtt_status_task = None
         self.mqtt_command_lock = asyncio.Lock()
+        self.phase = None  # last phase written to the EdgeDevice
 
     async def update_phase(self, phase: str):
-        await update_edgedevice_phase(self.k8s_api, phase)
+        # Reconnect attempts repeat the same phase every few seconds; only patch the CRD on a change
+        if phase == self.phase:
+            return
+        if await update_edgedevice_phase(self.k8s_api, phase):
+            self.phase = phase
 
     async def start_mqtt(self):
         while True:
@@ -137,7 +154,7 @@ class RobotDogDeviceShifu:
                         await client.subscribe(MQTT_TOPIC_STATUS)
                         async for msg in messages:
                             try:
-                                self.status_payload = json.loads(msg.payload.decode())
+                                self.status_payload = json_loads(msg.payload)
                                 logger.info(f"Received status: {self.status_payload}")
                             except Exception as e:
                                 logger.warning(f"Invalid status payload: {e}")
@@ -158,10 +175,10 @@ class RobotDogDeviceShifu:
             logger.error("MQTT not connected.")
             return False
         async with self.mqtt_command_lock:
-            payload = json.dumps({"command": command})
+            payload = COMMAND_PAYLOADS[command]
             try:
                 await self.mqtt_client.publish(MQTT_TOPIC_COMMAND, payload)
-                logger.info(f"Published command: {payload}")
+                logger.info(f"Published command: {command}")
                 return True
             except Exception as e:
                 logger.error(f"Failed to publish command: {e}")
@@ -214,11 +231,13 @@ async def start_background_tasks(app):
     app['mqtt_task'] = asyncio.create_task(robot_shifu.start_mqtt())
 
 async def cleanup_background_tasks(app):
+    # Cancelling the listener leaves its `async with` block, which disconnects from the broker
     app['mqtt_task'].cancel()
     try:
         await app['mqtt_task']
     except asyncio.CancelledError:
         pass
+    robot_shifu.mqtt_connected = False
 
 def main():
     app = web.Application()
@@ -226,16 +245,7 @@ def main():
     app.on_startup.append(start_background_tasks)
     app.on_cleanup.append(cleanup_background_tasks)
 
-    loop = asyncio.get_event_loop()
-
-    # Graceful shutdown
-    def shutdown():
-        for task in asyncio.Task.all_tasks(loop):
-            task.cancel()
-
-    for sig in (signal.SIGTERM, signal.SIGINT):
-        loop.add_signal_handler(sig, shutdown)
-
+    # run_app handles SIGINT/SIGTERM itself and runs the cleanup hooks, which close the MQTT session
     try:
         web.run_app(app, host=HTTP_SERVER_HOST, port=HTTP_SERVER_PORT)
     except Exception as e:
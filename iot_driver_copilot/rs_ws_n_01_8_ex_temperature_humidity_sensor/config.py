@@ -1,14 +1,19 @@
+import functools
 import os
+import struct
 
-def _get_env_str(name, default=None, required=False):
-    val = os.getenv(name, default)
+# Value layout for (REG_COUNT, signed); registers are big-endian words, high word first
+_REGISTER_FORMATS = {(1, False): ">H", (1, True): ">h", (2, False): ">I", (2, True): ">i"}
+
+def _get_env_str(env, name, default=None, required=False):
+    val = env.get(name, default)
     if required and (val is None or val == ""):
         raise ValueError(f"Missing required environment variable: {name}")
     return val
 
 
-def _get_env_int(name, default=None, required=False):
-    val = os.getenv(name)
+def _get_env_int(env, name, default=None, required=False):
+    val = env.get(name)
     if val is None or val == "":
         if required and default is None:
             raise ValueError(f"Missing required environment variable: {name}")
@@ -19,8 +24,8 @@ def _get_env_int(name, default=None, required=False):
         raise ValueError(f"Invalid int for {name}: {val}")
 
 
-def _get_env_float(name, default=None, required=False):
-    val = os.getenv(name)
+def _get_env_float(env, name, default=None, required=False):
+    val = env.get(name)
     if val is None or val == "":
         if required and default is None:
             raise ValueError(f"Missing required environment variable: {name}")
@@ -31,8 +36,8 @@ def _get_env_float(name, default=None, required=False):
         raise ValueError(f"Invalid float for {name}: {val}")
 
 
-def _get_env_bool(name, default=False):
-    val = os.getenv(name)
+def _get_env_bool(env, name, default=False):
+    val = env.get(name)
     if val is None or val == "":
         return default
     return val.strip().lower() in ("1", "true", "t", "yes", "y", "on")
@@ -40,41 +45,49 @@ def _get_env_bool(name, default=False):
 
 class Config:
     def __init__(self):
+        # One copy of the environment; every setting below is a plain dict lookup
+        env = os.environ.copy()
+
         # HTTP server configuration
-        self.http_host = _get_env_str("HTTP_HOST", "0.0.0.0")
-        self.http_port = _get_env_int("HTTP_PORT", 8000)
+        self.http_host = _get_env_str(env, "HTTP_HOST", "0.0.0.0")
+        self.http_port = _get_env_int(env, "HTTP_PORT", 8000)
 
         # Modbus RTU serial configuration
-        self.modbus_port = _get_env_str("MODBUS_PORT", "/dev/ttyUSB0")
-        self.modbus_baudrate = _get_env_int("MODBUS_BAUDRATE", 9600)
-        self.modbus_parity = _get_env_str("MODBUS_PARITY", "N").upper()
+        self.modbus_port = _get_env_str(env, "MODBUS_PORT", "/dev/ttyUSB0")
+        self.modbus_baudrate = _get_env_int(env, "MODBUS_BAUDRATE", 9600)
+        self.modbus_parity = _get_env_str(env, "MODBUS_PARITY", "N").upper()
         if self.modbus_parity not in ("N", "E", "O"):
             raise ValueError("MODBUS_PARITY must be one of N, E, O")
-        self.modbus_stopbits = _get_env_int("MODBUS_STOPBITS", 1)
-        self.modbus_bytesize = _get_env_int("MODBUS_BYTESIZE", 8)
-        self.modbus_slave_id = _get_env_int("MODBUS_SLAVE_ID", 1)
-        self.modbus_timeout_sec = _get_env_float("MODBUS_TIMEOUT_SEC", 2.0)
+        self.modbus_stopbits = _get_env_int(env, "MODBUS_STOPBITS", 1)
+        self.modbus_bytesize = _get_env_int(env, "MODBUS_BYTESIZE", 8)
+        self.modbus_slave_id = _get_env_int(env, "MODBUS_SLAVE_ID", 1)
+        self.modbus_timeout_sec = _get_env_float(env, "MODBUS_TIMEOUT_SEC", 2.0)
 
         # Polling and resilience
-        self.poll_interval_sec = _get_env_float("POLL_INTERVAL_SEC", 2.0)
-        self.backoff_initial_sec = _get_env_float("BACKOFF_INITIAL_SEC", 1.0)
-        self.backoff_max_sec = _get_env_float("BACKOFF_MAX_SEC", 30.0)
+        self.poll_interval_sec = _get_env_float(env, "POLL_INTERVAL_SEC", 2.0)
+        self.backoff_initial_sec = _get_env_float(env, "BACKOFF_INITIAL_SEC", 1.0)
+        self.backoff_max_sec = _get_env_float(env, "BACKOFF_MAX_SEC", 30.0)
 
         # Register selection
-        self.read_func = _get_env_str("MODBUS_FUNC", "holding").strip().lower()
+        self.read_func = _get_env_str(env, "MODBUS_FUNC", "holding").strip().lower()
         if self.read_func not in ("holding", "input"):
             raise ValueError("MODBUS_FUNC must be 'holding' or 'input'")
-        self.temp_reg_addr = _get_env_int("TEMP_REG_ADDR", 1)
-        self.hum_reg_addr = _get_env_int("HUM_REG_ADDR", 2)
-        self.reg_count = _get_env_int("REG_COUNT", 1)
+        self.temp_reg_addr = _get_env_int(env, "TEMP_REG_ADDR", 1)
+        self.hum_reg_addr = _get_env_int(env, "HUM_REG_ADDR", 2)
+        self.reg_count = _get_env_int(env, "REG_COUNT", 1)
         if self.reg_count not in (1, 2):
             raise ValueError("REG_COUNT must be 1 or 2")
 
         # Scaling and signedness (set scale to 1.0 to return raw device value)
-        self.scale_temp = _get_env_float("SCALE_TEMP", 1.0)
-        self.scale_hum = _get_env_float("SCALE_HUM", 1.0)
-        self.signed_temp = _get_env_bool("SIGNED_TEMP", True)
-        self.signed_hum = _get_env_bool("SIGNED_HUM", False)
+        self.scale_temp = _get_env_float(env, "SCALE_TEMP", 1.0)
+        self.scale_hum = _get_env_float(env, "SCALE_HUM", 1.0)
+        self.signed_temp = _get_env_bool(env, "SIGNED_TEMP", True)
+        self.signed_hum = _get_env_bool(env, "SIGNED_HUM", False)
+
+        # Register decoding, built once: the words are packed back to bytes and read as one value
+        self.register_packer = struct.Struct(f">{self.reg_count}H")
+        self.temp_decoder = struct.Struct(_REGISTER_FORMATS[(self.reg_count, self.signed_temp)])
+        self.hum_decoder = struct.Struct(_REGISTER_FORMATS[(self.reg_count, self.signed_hum)])
 
     def __repr__(self):
         return (
@@ -86,3 +99,9 @@ class Config:
             f"func={self.read_func}, temp_reg={self.temp_reg_addr}, hum_reg={self.hum_reg_addr}, reg_count={self.reg_count}, "
             f"scale_temp={self.scale_temp}, scale_hum={self.scale_hum}, signed_temp={self.signed_temp}, signed_hum={self.signed_hum})"
         )
+
+
+@functools.lru_cache(maxsize=1)
+def get_config():
+    # Settings are read once per process; the Config is not modified after construction
+    return Config()
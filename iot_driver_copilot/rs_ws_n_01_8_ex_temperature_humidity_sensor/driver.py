@@ -8,7 +8,7 @@ from typing import Optional, Tuple
 from flask import Flask, Response
 from pymodbus.client import ModbusSerialClient
 
-from config import Config
+from config import Config, get_config
 
 
 logging.basicConfig(
@@ -95,20 +95,9 @@ class ModbusCollector(threading.Thread):
             self._client = None
             logger.info("Modbus disconnected")
 
-    def _combine_registers(self, regs, signed=False):
-        if len(regs) == 1:
-            val = regs[0]
-            if signed and val >= 0x8000:
-                val -= 0x10000
-            return val
-        elif len(regs) == 2:
-            val = (regs[0] << 16) | regs[1]
-            if signed and val >= 0x80000000:
-                val -= 0x100000000
-            return val
-        else:
-            # Should not happen with current cfg
-            return None
+    def _combine_registers(self, regs, decoder):
+        # Raises struct.error if the device returned a different number of registers than configured
+        return decoder.unpack(self.cfg.register_packer.pack(*regs))[0]
 
     def _read_registers(self, address: int, count: int, slave: int, func: str):
         if func == 'holding':
@@ -142,9 +131,7 @@ class ModbusCollector(threading.Thread):
                     raise IOError(f"Temp read error: {rr_t}")
                 if not hasattr(rr_t, 'registers') or rr_t.registers is None:
                     raise IOError("Temp read returned no registers")
-                raw_t = self._combine_registers(rr_t.registers, signed=self.cfg.signed_temp)
-                if raw_t is None:
-                    raise IOError("Temp register combine failed")
+                raw_t = self._combine_registers(rr_t.registers, self.cfg.temp_decoder)
                 val_t = float(raw_t) * float(self.cfg.scale_temp)
                 self.buffer.set_temp(val_t)
 
@@ -159,9 +146,7 @@ class ModbusCollector(threading.Thread):
                     raise IOError(f"Humidity read error: {rr_h}")
                 if not hasattr(rr_h, 'registers') or rr_h.registers is None:
                     raise IOError("Humidity read returned no registers")
-                raw_h = self._combine_registers(rr_h.registers, signed=self.cfg.signed_hum)
-                if raw_h is None:
-                    raise IOError("Humidity register combine failed")
+                raw_h = self._combine_registers(rr_h.registers, self.cfg.hum_decoder)
                 val_h = float(raw_h) * float(self.cfg.scale_hum)
                 self.buffer.set_hum(val_h)
 
@@ -205,7 +190,7 @@ def create_app(cfg: Config, buffer: DataBuffer) -> Flask:
 
 
 def main():
-    cfg = Config()
+    cfg = get_config()
     logger.info("Starting with %s", cfg)
 
     buffer = DataBuffer()
@@ -1,6 +1,8 @@
 import os
 import io
 import json
+import time
+import base64
 from flask import Flask, Response, jsonify, request, stream_with_context
 
 app = Flask(__name__)
@@ -11,43 +13,52 @@ DEVICE_MODEL = os.getenv("DEVICE_MODEL", "DS-2CE16D0T-IRF")
 DEVICE_MANUFACTURER = os.getenv("DEVICE_MANUFACTURER", "海康威视")
 DEVICE_TYPE = os.getenv("DEVICE_TYPE", "摄像机")
 
+# Device info is fixed at startup; serialize it once rather than per request
+DEVICE_INFO_JSON = json.dumps({
+    "device_name": DEVICE_NAME,
+    "device_model": DEVICE_MODEL,
+    "manufacturer": DEVICE_MANUFACTURER,
+    "device_type": DEVICE_TYPE
+}, separators=(",", ":")).encode()
+# The feed status only varies in stream_url, so everything before it is serialized once too
+FEED_STATUS_PREFIX = json.dumps({
+    "resolution": "1920x1080 (1080P)",
+    "infrared_range": "20m",
+    "lens_options": ["2.8mm", "3.6mm", "6mm"],
+    "protection_grade": "IP66",
+    "video_output": "TVI",
+    "power_input": "12V DC ±25%"
+}, separators=(",", ":")).encode()[:-1] + b',"stream_url":'
+# Fixed for the life of the process, so pollers may reuse it
+STATIC_JSON_HEADERS = {"Cache-Control": "max-age=300"}
+
 SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
 SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
 
-# Simulated TVI video stream generator (for demo only; in real use, replace with TVI capture logic)
-def simulated_video_stream():
-    # Simulate a multipart MJPEG HTTP stream with dummy JPEGs.
-    # In real integration, replace this logic with actual TVI signal capture and encoding.
-    import time
-    import base64
+# Simulated TVI video stream (for demo only; in real use, replace with TVI capture logic).
+# A single black pixel JPEG; it never changes, so the whole multipart part is built once
+SIMULATED_JPEG = base64.b64decode(
+    b'/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19iZ2hnPk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2P/wAARCAABAAEDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwDz+iiigD//2Q=='
+)
+SIMULATED_PART = (
+    b"--frame\r\n"
+    b"Content-Type: image/jpeg\r\n"
+    b"Content-Length: %d\r\n\r\n" % len(SIMULATED_JPEG)
+) + SIMULATED_JPEG + b"\r\n"
 
-    # A single black pixel JPEG
-    jpeg_bytes = base64.b64decode(
-        b'/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SEhQeGBoZFxcZGhohJCQkIC4nICIsKyIrLCk9NDQ0NTw7QDs+RkZGRj5IRz9JR0w4QkJCT0xK/2wBDAQ8NDhISFBQeGBoZGhoaGCgrKycrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrK//AABEIAAEAAQMBIgACEQEDEQH/xAAbAAACAgMBAAAAAAAAAAAAAAAFBgIDBAEAB//EADwQAAEDAgQDBgUEAgICAwAAAAEAAgMEEQUSITFBUQYTImFxgZEykaEUM0JSscHR8BVCU2KistHx/8QAGQEBAAMBAQAAAAAAAAAAAAAAAAIDBAEF/8QAJREBAAICAgICAgMBAAAAAAAAAAERAhIhAzFBUQRRImFxkcH/2gAMAwEAAhEDEQA/AO6iIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgCIiAIiIAiIgP/Z'
-    )
-    boundary = "--frame"
+def simulated_video_stream():
+    # In real integration, replace this logic with actual TVI signal capture and encoding;
+    # the sleep stands in for the capture device's frame interval
     while True:
-        yield (
-            f"{boundary}\r\n"
-            "Content-Type: image/jpeg\r\n"
-            f"Content-Length: {len(jpeg_bytes)}\r\n\r\n"
-        ).encode("utf-8") + jpeg_bytes + b"\r\n"
+        yield SIMULATED_PART
         time.sleep(0.05)  # 20 FPS
 
 @app.route("/video/feed", methods=["GET"])
 def video_feed():
     # Accepts ?status=1 to return config/status JSON, otherwise streams video
     if request.args.get("status") == "1":
-        info = {
-            "resolution": "1920x1080 (1080P)",
-            "infrared_range": "20m",
-            "lens_options": ["2.8mm", "3.6mm", "6mm"],
-            "protection_grade": "IP66",
-            "video_output": "TVI",
-            "power_input": "12V DC ±25%",
-            "stream_url": f"http://{request.host}/video/feed"
-        }
-        return jsonify(info)
+        stream_url = json.dumps(f"http://{request.host}/video/feed").encode()
+        return Response(FEED_STATUS_PREFIX + stream_url + b"}", mimetype="application/json")
     # Otherwise, stream simulated MJPEG video (HTTP multipart/x-mixed-replace)
     return Response(
         stream_with_context(simulated_video_stream()),
@@ -56,13 +67,7 @@ def video_feed():
 
 @app.route("/device/info", methods=["GET"])
 def device_info():
-    info = {
-        "device_name": DEVICE_NAME,
-        "device_model": DEVICE_MODEL,
-        "manufacturer": DEVICE_MANUFACTURER,
-        "device_type": DEVICE_TYPE
-    }
-    return jsonify(info)
+    return Response(DEVICE_INFO_JSON, mimetype="application/json", headers=STATIC_JSON_HEADERS)
 
 @app.route("/commands/das", methods=["POST"])
 def command_das():
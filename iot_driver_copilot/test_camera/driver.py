@@ -1,20 +1,63 @@
-```python
 import os
+import sys
 import cv2
 import io
 import json
 import threading
-import time
-from flask import Flask, Response, request, jsonify, send_file, abort
+from flask import Flask, Response, request, jsonify, abort
+from flask.json.provider import DefaultJSONProvider
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+try:
+    import orjson
+except ImportError:
+    orjson = None  # fall back to Flask's stdlib json provider
+
+# Cameras already run on their own threads; keep OpenCV from spawning a pool inside every encode/resize
+cv2.setNumThreads(1)
 
 app = Flask(__name__)
 
+class ORJSONProvider(DefaultJSONProvider):
+    # orjson serializes straight to UTF-8 and is several times faster than the stdlib encoder
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
 # Configuration from environment variables
 SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
 SERVER_PORT = int(os.environ.get("SERVER_PORT", "8080"))
 CAMERA_DEFAULT_ID = int(os.environ.get("CAMERA_ID", "0"))
 CAMERA_DEFAULT_RES = os.environ.get("CAMERA_RESOLUTION", "640x480")
 CAMERA_DEFAULT_FRAME_RATE = int(os.environ.get("CAMERA_FRAME_RATE", "30"))
+FRAME_TIMEOUT = float(os.environ.get("CAMERA_FRAME_TIMEOUT", "5"))
+# Stream frames only need to look right in motion; captures keep encode_jpeg's full quality
+STREAM_JPEG_QUALITY = int(os.environ.get("STREAM_JPEG_QUALITY", "70"))
+# Prefer V4L2 on Linux so buffer size and pixel format requests reach the driver
+CAPTURE_BACKEND = cv2.CAP_V4L2 if sys.platform.startswith("linux") else cv2.CAP_ANY
+PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+PART_MID = b'\r\n\r\n'
+PART_TAIL = b'\r\n'
+
+def encode_jpeg(frame, quality=95):
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ret:
+        return None
+    return jpeg.tobytes()
+
+def is_jpeg_buffer(frame):
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
 
 # Camera State Management
 class CameraManager:
@@ -70,31 +113,104 @@ class CameraInstance:
         self.width = width
         self.height = height
         self.frame_rate = frame_rate
-        self.cap = cv2.VideoCapture(cam_id)
+        self.cap = cv2.VideoCapture(cam_id, CAPTURE_BACKEND)
         self.set_props(width, height, frame_rate)
-        self.last_frame = None
         self.active = self.cap.isOpened()
+        # (frame_id, frame, jpeg) replaced wholesale by the grabber thread; readers take it without locking
+        self.latest = None
+        self.new_frame = threading.Condition()
+        self.consumers = 0  # open streams and captures waiting for a frame
+        self.running = self.active
+        self.thread = None
+        if self.active:
+            # Discard the first frames while the sensor settles
+            for _ in range(2):
+                self.cap.grab()
+            self.thread = threading.Thread(target=self._grab, daemon=True)
+            self.thread.start()
 
     def set_props(self, width, height, frame_rate):
+        # Request MJPG and keep it compressed so stream/capture can forward the camera's JPEG as-is
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        if int(self.cap.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG'):
+            # Only a camera that agreed to MJPG hands back JPEG bytes; others still need converting
+            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
         self.cap.set(cv2.CAP_PROP_FPS, frame_rate)
+        # Keep a single queued frame so reads never return a stale image
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
     def is_active(self):
         return self.cap.isOpened()
 
     def release(self):
+        self.running = False
+        with self.new_frame:
+            self.new_frame.notify_all()
+        if self.thread is not None:
+            self.thread.join(FRAME_TIMEOUT)
+            self.thread = None
         if self.cap.isOpened():
             self.cap.release()
 
-    def read(self):
-        if not self.cap.isOpened():
+    def _grab(self):
+        # Only this thread touches cap, so reading never holds up /capture or other streams
+        frame_id = 0
+        while self.running:
+            if not self.cap.grab():
+                break
+            # Nobody is waiting for this frame: leave it undecoded and unencoded
+            if not self.consumers:
+                continue
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                break
+            jpeg = frame.tobytes() if is_jpeg_buffer(frame) else encode_jpeg(frame, STREAM_JPEG_QUALITY)
+            if jpeg is None:
+                continue
+            frame_id += 1
+            self.latest = (frame_id, frame, jpeg)
+            with self.new_frame:
+                self.new_frame.notify_all()
+        self.running = False
+        with self.new_frame:
+            self.new_frame.notify_all()
+
+    def subscribe(self):
+        with self.new_frame:
+            self.consumers += 1
+
+    def unsubscribe(self):
+        with self.new_frame:
+            self.consumers -= 1
+
+    def wait_frame(self, last_id=0):
+        # Returns (frame_id, frame, jpeg) for the first frame newer than last_id, or None
+        latest = self.latest
+        if latest is None or latest[0] == last_id:
+            with self.new_frame:
+                self.new_frame.wait_for(
+                    lambda: not self.running or (self.latest is not None and self.latest[0] != last_id),
+                    FRAME_TIMEOUT)
+            latest = self.latest
+        if latest is None or latest[0] == last_id:
             return None
-        ret, frame = self.cap.read()
-        if ret:
-            self.last_frame = frame
-            return frame
-        return None
+        return latest
+
+    def read_jpeg(self):
+        # The published frame is stale if nobody was consuming, so always wait for the next one
+        self.subscribe()
+        try:
+            latest = self.latest
+            latest = self.wait_frame(latest[0] if latest is not None else 0)
+        finally:
+            self.unsubscribe()
+        if latest is None:
+            return None
+        _, frame, jpeg = latest
+        # Passthrough JPEGs are the camera's own; encoded ones are stream quality, so re-encode at full quality
+        return jpeg if is_jpeg_buffer(frame) else encode_jpeg(frame)
 
     def status(self):
         return {
@@ -151,19 +267,25 @@ def camera_stream():
         return jsonify({"error": "Camera not started"}), 404
 
     def mjpeg_stream(cam):
-        while True:
-            frame = cam.read()
-            if frame is None:
-                break
-            ret, jpeg = cv2.imencode('.jpg', frame)
-            if not ret:
-                continue
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            time.sleep(1.0 / cam.frame_rate)
+        frame_id = 0
+        part_sep = b''
+        cam.subscribe()
+        try:
+            while True:
+                latest = cam.wait_frame(frame_id)
+                if latest is None:
+                    break
+                frame_id, _, jpeg = latest
+                # The previous part's CRLF rides on this header, so each frame is two writes
+                yield part_sep + PART_PREFIX + b'%d' % len(jpeg) + PART_MID
+                yield jpeg
+                part_sep = PART_TAIL
+        finally:
+            cam.unsubscribe()
 
     return Response(mjpeg_stream(cam),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+                    mimetype='multipart/x-mixed-replace; boundary=frame',
+                    direct_passthrough=True)
 
 @app.route("/camera/capture", methods=["GET"])
 def camera_capture():
@@ -171,13 +293,10 @@ def camera_capture():
     cam = camera_manager.get(cam_id)
     if not cam:
         return jsonify({"error": "Camera not started"}), 404
-    frame = cam.read()
-    if frame is None:
+    jpeg = cam.read_jpeg()
+    if jpeg is None:
         return jsonify({"error": "Failed to capture image"}), 500
-    ret, jpeg = cv2.imencode('.jpg', frame)
-    if not ret:
-        return jsonify({"error": "JPEG encoding failed"}), 500
-    return Response(jpeg.tobytes(),
+    return Response(jpeg,
                     mimetype='image/jpeg',
                     headers={"Content-Disposition": "attachment; filename=capture.jpg"})
 
@@ -187,18 +306,15 @@ def camera_snapshot():
     cam = camera_manager.get(cam_id)
     if not cam:
         return jsonify({"error": "Camera not started"}), 404
-    frame = cam.read()
-    if frame is None:
+    jpeg = cam.read_jpeg()
+    if jpeg is None:
         return jsonify({"error": "Failed to capture image"}), 500
-    ret, jpeg = cv2.imencode('.jpg', frame)
-    if not ret:
-        return jsonify({"error": "JPEG encoding failed"}), 500
-    b64 = base64_encode(jpeg.tobytes())
+    b64 = base64_encode(jpeg)
     return jsonify({
         "id": int(cam_id),
         "format": "jpeg",
         "image_data_base64": b64,
-        "size": len(jpeg.tobytes())
+        "size": len(jpeg)
     })
 
 def base64_encode(data):
@@ -207,4 +323,3 @@ def base64_encode(data):
 
 if __name__ == "__main__":
     app.run(host=SERVER_HOST, port=SERVER_PORT, threaded=True)
-```
\ No newline at end of file
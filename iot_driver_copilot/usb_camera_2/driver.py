@@ -1,12 +1,55 @@
 import os
-import io
+import sys
 import cv2
 import time
+import uuid
+import queue
+import tempfile
 import threading
 import numpy as np
 from flask import Flask, Response, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.serving import WSGIRequestHandler
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+try:
+    from pyspng import encode as spng_encode  # pyspng-seunglab; the original pyspng only decodes
+except ImportError:
+    spng_encode = None  # fall back to cv2.imencode
+try:
+    import orjson
+except ImportError:
+    orjson = None  # fall back to Flask's stdlib json provider
+try:
+    import pyudev
+except ImportError:
+    pyudev = None  # no hotplug notifications; rescan sysfs on every listing
+
+# Cameras already run on their own threads; keep OpenCV from spawning a pool inside every encode/resize
+cv2.setNumThreads(1)
 
 app = Flask(__name__)
+# Recordings are one-off temp files; never let clients cache them
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+
+class BufferedRequestHandler(WSGIRequestHandler):
+    # The dev server writes each chunked-encoding piece (size line, data, CRLF) to the socket on its own
+    # and flushes after every yielded chunk; buffering the pieces turns each flush into a single send
+    wbufsize = 256 * 1024
+
+class ORJSONProvider(DefaultJSONProvider):
+    # orjson serializes straight to UTF-8 and is several times faster than the stdlib encoder
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 
 # Configuration from environment variables
 SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
@@ -17,33 +60,257 @@ DEFAULT_WIDTH = int(os.environ.get("DEFAULT_WIDTH", "640"))
 DEFAULT_HEIGHT = int(os.environ.get("DEFAULT_HEIGHT", "480"))
 DEFAULT_FORMAT = os.environ.get("DEFAULT_FORMAT", "MJPEG")
 MAX_RECORD_DURATION = int(os.environ.get("MAX_RECORD_DURATION", "60"))
+FRAME_TIMEOUT = float(os.environ.get("FRAME_TIMEOUT", "5"))
+CAMERA_CACHE_TTL = float(os.environ.get("CAMERA_CACHE_TTL", "60"))
+# Streams tolerate a lower quality than captures and recordings; it cuts encode time and bytes per frame
+STREAM_JPEG_QUALITY = int(os.environ.get("STREAM_JPEG_QUALITY", "70"))
+# A stream that skipped more than this many frames gets half-size frames at LAG_JPEG_QUALITY until it
+# keeps up again; 0 turns the fallback off
+STREAM_LAG_FRAMES = int(os.environ.get("STREAM_LAG_FRAMES", "2"))
+LAG_JPEG_QUALITY = int(os.environ.get("LAG_JPEG_QUALITY", "50"))
 
 SUPPORTED_FORMATS = ['JPEG', 'PNG', 'MP4', 'MJPEG']
+PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+PART_MID = b'\r\n\r\n'
+PART_TAIL = b'\r\n'
+V4L_SYSFS = "/sys/class/video4linux"
+RECORD_FOURCC = {'MP4': cv2.VideoWriter_fourcc(*'mp4v'), 'MJPEG': cv2.VideoWriter_fourcc(*'MJPG')}
+# Recordings are written to one private directory with unique names, so concurrent requests never collide
+RECORD_TMP = tempfile.mkdtemp(prefix="cam_rec_")
+# Hardware H.264 encoders tried in order for MP4 recordings when OpenCV was built with GStreamer
+GST_H264_ENCODERS = [e for e in os.environ.get("GST_H264_ENCODERS", "vaapih264enc,nvh264enc,v4l2h264enc").split(",") if e]
+HAVE_GSTREAMER = any(line.strip().startswith("GStreamer:") and "YES" in line
+                     for line in cv2.getBuildInformation().splitlines())
+# Fragment length of /cam/stream.mp4; players start on the first fragment, so shorter means less delay
+MP4_FRAGMENT_MS = int(os.environ.get("MP4_FRAGMENT_MS", "500"))
+# Resizes can run on an iGPU through OpenCV's T-API; opt in since upload/download only pays off on some SoCs
+USE_OPENCL = os.environ.get("USE_OPENCL", "0") == "1" and cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(USE_OPENCL)
+# Prefer V4L2 on Linux so buffer size and pixel format requests reach the driver
+CAPTURE_BACKEND = cv2.CAP_V4L2 if sys.platform.startswith("linux") else cv2.CAP_ANY
+
+def encode_jpeg(frame, quality=95):
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ret:
+        return None
+    return buf.tobytes()
+
+def encode_png(frame):
+    if spng_encode is not None:
+        # libspng's SIMD filters and CRC outrun libpng at the same level; it takes RGB order
+        return spng_encode(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), compress_level=1)
+    ret, buf = cv2.imencode('.png', frame)
+    return buf.tobytes() if ret else None
+
+def is_jpeg_buffer(frame):
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
 
-def list_available_cameras(max_cameras=10):
+def decode_frame(frame):
+    if is_jpeg_buffer(frame):
+        return cv2.imdecode(frame, cv2.IMREAD_COLOR)
+    return frame
+
+def resize_frame(frame, width, height):
+    # Skip the full-frame copy when the size already matches; pick the cheaper filter per direction
+    if (width, height) == frame.shape[1::-1]:
+        return frame
+    interpolation = cv2.INTER_AREA if width < frame.shape[1] else cv2.INTER_LINEAR
+    if USE_OPENCL:
+        return cv2.resize(cv2.UMat(frame), (width, height), interpolation=interpolation).get()
+    return cv2.resize(frame, (width, height), interpolation=interpolation)
+
+# Scales libjpeg can decode at directly from the DCT coefficients, largest reduction first
+REDUCED_DECODES = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def decode_resized(frame, width, height, native_size):
+    # A camera JPEG bound for a smaller size is decoded at the largest reduction that still covers it,
+    # which skips most of the IDCT work and leaves the resize a fraction of the pixels
+    if is_jpeg_buffer(frame):
+        for factor, flag in REDUCED_DECODES:
+            if width * factor <= native_size[0] and height * factor <= native_size[1]:
+                return resize_frame(cv2.imdecode(frame, flag), width, height)
+        frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+    return resize_frame(frame, width, height)
+
+gst_encoder = None  # None: not probed yet, "": no hardware encoder, else the element that worked
+
+def open_gst_h264_writer(mux, fps, size):
+    # Hardware H.264 through GStreamer, ending in the given mux/sink; None when no encoder element works
+    global gst_encoder
+    if HAVE_GSTREAMER and gst_encoder != "":
+        for encoder in [gst_encoder] if gst_encoder else GST_H264_ENCODERS:
+            pipeline = f"appsrc ! videoconvert ! {encoder} ! h264parse ! {mux}"
+            out = cv2.VideoWriter(pipeline, cv2.CAP_GSTREAMER, 0, fps, size, True)
+            if out.isOpened():
+                gst_encoder = encoder
+                return out
+            out.release()
+        gst_encoder = ""
+    return None
+
+def open_mp4_writer(filename, fps, size):
+    # Prefer a hardware encoder through GStreamer; OpenCV's mp4v writer encodes on the CPU
+    out = open_gst_h264_writer(f"mp4mux ! filesink location={filename}", fps, size)
+    if out is not None:
+        return out
+    return cv2.VideoWriter(filename, RECORD_FOURCC['MP4'], fps, size)
+
+def scan_cameras():
+    # Enumerate from sysfs rather than opening each /dev/videoN, which takes hundreds of ms
+    # per probe and briefly grabs the device away from an active stream
     available = []
-    for i in range(max_cameras):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            available.append(i)
-            cap.release()
-    return available
+    try:
+        names = os.listdir(V4L_SYSFS)
+    except OSError:
+        return available
+    for name in names:
+        if not name.startswith("video") or not name[5:].isdigit():
+            continue
+        try:
+            # UVC cameras also expose metadata nodes; index 0 is the capture node
+            with open(os.path.join(V4L_SYSFS, name, "index")) as f:
+                if int(f.read().strip()) != 0:
+                    continue
+        except (OSError, ValueError):
+            pass
+        available.append(int(name[5:]))
+    return sorted(available)
+
+camera_cache = None
+camera_cache_time = 0.0
+camera_cache_lock = threading.Lock()
+udev_observer = None
+
+def invalidate_camera_cache(device=None):
+    global camera_cache
+    with camera_cache_lock:
+        camera_cache = None
+
+if pyudev is not None:
+    try:
+        udev_monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        udev_monitor.filter_by(subsystem="video4linux")
+        udev_observer = pyudev.MonitorObserver(udev_monitor, callback=invalidate_camera_cache)
+        udev_observer.start()
+    except Exception:
+        udev_observer = None
+
+def list_available_cameras():
+    global camera_cache, camera_cache_time
+    # udev invalidates the list on hotplug; without it, expire the list after CAMERA_CACHE_TTL
+    with camera_cache_lock:
+        now = time.monotonic()
+        if camera_cache is None or (udev_observer is None and now - camera_cache_time > CAMERA_CACHE_TTL):
+            camera_cache = scan_cameras()
+            camera_cache_time = now
+        return list(camera_cache)
+
+# One reader per camera: streams, captures and recordings share each grabbed and encoded frame
+class FrameFanout:
+    def __init__(self, cap):
+        self.cap = cap
+        self.cond = threading.Condition()
+        # (frame_id, frame, jpeg) replaced wholesale by the reader; consumers take it without locking
+        self.latest = (0, None, None)
+        self.subscribers = 0  # open streams and recordings
+        self.waiters = 0  # one-shot captures waiting for the next frame
+        # (width, height, quality): (frame_id, jpeg) for resized streams, so viewers at one size share an encode
+        self.scaled = {}
+        self.scale_locks = {}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(FRAME_TIMEOUT)
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            if not self.cap.grab():
+                break
+            # Nobody is waiting for this frame: leave it undecoded and unencoded
+            if not (self.subscribers or self.waiters):
+                continue
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                break
+            jpeg = frame.tobytes() if is_jpeg_buffer(frame) else encode_jpeg(frame, STREAM_JPEG_QUALITY)
+            if jpeg is None:
+                continue
+            self.latest = (self.latest[0] + 1, frame, jpeg)
+            with self.cond:
+                self.cond.notify_all()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def wait_new(self, last_id=None):
+        # Returns (frame_id, frame, jpeg) for the first frame newer than last_id (None: the next frame)
+        latest = self.latest
+        if last_id is None:
+            last_id = latest[0]
+        elif latest[0] != last_id and self.running:
+            # A stream that is behind the reader takes the frame without touching the lock
+            return latest
+        with self.cond:
+            self.waiters += 1
+            try:
+                self.cond.wait_for(lambda: self.latest[0] != last_id or not self.running, FRAME_TIMEOUT)
+            finally:
+                self.waiters -= 1
+        latest = self.latest
+        if not self.running or latest[0] == last_id:
+            return last_id, None, None
+        return latest
+
+    def native_size(self):
+        # The negotiated capture mode; passthrough frames are undecoded, so their shape says nothing
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def scaled_jpeg(self, frame_id, frame, size, quality=STREAM_JPEG_QUALITY):
+        key = (*size, quality)
+        cached = self.scaled.get(key)
+        if cached is None or cached[0] != frame_id:
+            # The first viewer at this size encodes; the others wait and reuse its bytes
+            with self.scale_locks.setdefault(key, threading.Lock()):
+                cached = self.scaled.get(key)
+                if cached is None or cached[0] != frame_id:
+                    jpeg = encode_jpeg(decode_resized(frame, *size, self.native_size()), quality)
+                    cached = (frame_id, jpeg)
+                    self.scaled[key] = cached
+        return cached[1]
 
 class CameraManager:
     def __init__(self):
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
         self.cameras = {}
+        self.fanouts = {}
         self.current_cam_id = None
         self.width = DEFAULT_WIDTH
         self.height = DEFAULT_HEIGHT
         self.format = DEFAULT_FORMAT.upper() if DEFAULT_FORMAT.upper() in SUPPORTED_FORMATS else "MJPEG"
-        self.is_streaming = False
-        self.is_recording = False
-        self.recording_thread = None
-        self.recording_file = None
-        self.recording_stop_event = threading.Event()
-        self.available_cameras = list_available_cameras()
-        self.open_camera(self.available_cameras[0] if self.available_cameras else DEFAULT_CAMERA_ID)
+        available_cameras = list_available_cameras()
+        self.open_camera(available_cameras[0] if available_cameras else DEFAULT_CAMERA_ID)
 
     def list_cameras(self):
         return list_available_cameras()
@@ -56,10 +323,20 @@ class CameraManager:
             if cam_id in self.cameras:
                 self.cameras[cam_id].release()
                 del self.cameras[cam_id]
-            cap = cv2.VideoCapture(cam_id)
+            cap = cv2.VideoCapture(cam_id, CAPTURE_BACKEND)
             if cap.isOpened():
+                # Ask for MJPG on the wire and keep it compressed so streams can forward it untouched
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+                if int(cap.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG'):
+                    # Only a camera that agreed to MJPG hands back JPEG bytes; others still need converting
+                    cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
                 cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
                 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+                # Keep a single queued frame so reads never return a stale image
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                # Discard the first frames while the sensor settles
+                for _ in range(2):
+                    cap.grab()
                 self.cameras[cam_id] = cap
                 self.current_cam_id = cam_id
                 return True
@@ -81,6 +358,17 @@ class CameraManager:
                     return self.cameras[cam_id]
             return None
 
+    def get_fanout(self):
+        with self.lock:
+            if self.get_current_camera() is None:
+                return None
+            fanout = self.fanouts.get(self.current_cam_id)
+            if fanout is None or not fanout.running:
+                fanout = FrameFanout(self.cameras[self.current_cam_id])
+                fanout.start()
+                self.fanouts[self.current_cam_id] = fanout
+            return fanout
+
     def set_resolution(self, width, height):
         with self.lock:
             self.width = width
@@ -116,71 +404,192 @@ class CameraManager:
 
     def stop(self):
         with self.lock:
+            for fanout in self.fanouts.values():
+                fanout.stop()
+            self.fanouts.clear()
             for cam in self.cameras.values():
                 cam.release()
             self.cameras.clear()
             self.current_cam_id = None
-            self.is_streaming = False
-            self.is_recording = False
 
     def capture_frame(self, image_format=None, width=None, height=None):
-        cam = self.get_current_camera()
-        if cam is None:
-            return None, "Camera not found"
-        ret, frame = cam.read()
-        if not ret:
-            return None, "Failed to capture frame"
+        fanout = self.get_fanout()
+        if fanout is None:
+            return None, None, "Camera not found"
+        _, frame, jpeg = fanout.wait_new()
+        if frame is None:
+            return None, None, "Failed to capture frame"
+        # Returns (data, mimetype, error); PNG is the only still format besides JPEG, so JPEG, MJPEG,
+        # MP4 and unknown formats all capture a JPEG
+        if (image_format or self.format).upper() == 'PNG':
+            mimetype = 'image/png'
+        elif not (width and height) and is_jpeg_buffer(frame):
+            # The camera's own JPEG; frames the fanout encoded itself are only stream quality
+            return jpeg, 'image/jpeg', None
+        else:
+            mimetype = 'image/jpeg'
         if width and height:
-            frame = cv2.resize(frame, (width, height))
-        fmt = (image_format or self.format).upper()
-        if fmt not in SUPPORTED_FORMATS:
-            fmt = "JPEG"
-        ext = '.jpg' if fmt == 'JPEG' else ('.png' if fmt == 'PNG' else '.jpg')
-        ret, buf = cv2.imencode(ext, frame)
-        if not ret:
-            return None, "Failed to encode image"
-        return buf.tobytes(), None
+            frame = decode_resized(frame, width, height, fanout.native_size())
+        else:
+            frame = decode_frame(frame)
+        data = encode_png(frame) if mimetype == 'image/png' else encode_jpeg(frame)
+        if data is None:
+            return None, None, "Failed to encode image"
+        return data, mimetype, None
 
     def stream_generator(self, width=None, height=None, fmt=None):
-        cam = self.get_current_camera()
-        if cam is None:
+        fanout = self.get_fanout()
+        if fanout is None:
             return
         fmt = (fmt or self.format).upper()
         if fmt not in ['MJPEG', 'JPEG']:
             fmt = 'MJPEG'
-        while True:
-            ret, frame = cam.read()
-            if not ret:
-                break
-            if width and height:
-                frame = cv2.resize(frame, (width, height))
-            ret, jpeg = cv2.imencode('.jpg', frame)
-            if not ret:
-                continue
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            time.sleep(0.04)  # ~25fps
+        frame_id = None
+        part_sep = b''
+        native_width, native_height = fanout.native_size()
+        lag_size = ((width or native_width or self.width) // 2, (height or native_height or self.height) // 2)
+        fanout.subscribe()
+        try:
+            while True:
+                last_id = frame_id
+                frame_id, frame, jpeg = fanout.wait_new(frame_id)
+                if frame is None:
+                    break
+                if STREAM_LAG_FRAMES and last_id is not None and frame_id - last_id > STREAM_LAG_FRAMES:
+                    # Frames published while the last one was still being sent: the client's link is the
+                    # bottleneck, so send it smaller frames until it takes them as fast as they arrive
+                    jpeg = fanout.scaled_jpeg(frame_id, frame, lag_size, LAG_JPEG_QUALITY)
+                    if jpeg is None:
+                        continue
+                elif width and height:
+                    # The shared JPEG is native size; resized streams share one encode per size
+                    jpeg = fanout.scaled_jpeg(frame_id, frame, (width, height))
+                    if jpeg is None:
+                        continue
+                # The previous part's CRLF rides on this header, so each frame is two writes
+                yield part_sep + PART_PREFIX + b'%d' % len(jpeg) + PART_MID
+                yield jpeg
+                part_sep = PART_TAIL
+        finally:
+            fanout.unsubscribe()
+
+    def h264_stream(self, width=None, height=None):
+        # Fragmented MP4 from the hardware encoder; P-frames make it a fraction of the MJPEG bandwidth
+        fanout = self.get_fanout()
+        if fanout is None:
+            return None, None, "Camera not found"
+        size = (int(width or self.width), int(height or self.height))
+        native_size = fanout.native_size()
+        fps = fanout.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        read_fd, write_fd = os.pipe()
+        out = open_gst_h264_writer(f"mp4mux fragment-duration={MP4_FRAGMENT_MS} streamable=true ! fdsink fd={write_fd}",
+                                   fps, size)
+        if out is None:
+            os.close(read_fd)
+            os.close(write_fd)
+            return None, None, "No hardware H.264 encoder available; use /cam/stream"
+        streaming = threading.Event()
+        streaming.set()
+
+        def encode_frames():
+            # GStreamer writes the muxed fragments into the pipe as the encoder finishes them
+            frame_id = None
+            fanout.subscribe()
+            try:
+                while streaming.is_set():
+                    frame_id, frame, _ = fanout.wait_new(frame_id)
+                    if frame is None:
+                        break
+                    out.write(decode_resized(frame, *size, native_size))
+            finally:
+                fanout.unsubscribe()
+                out.release()
+                os.close(write_fd)
+
+        encoder = threading.Thread(target=encode_frames, daemon=True)
+        encoder.start()
+
+        def close():
+            # Closing the read end fails any write the muxer has pending, so the encoder thread exits.
+            # Called when generate() finishes and again when the response closes; the response also closes
+            # when the body was never iterated (HEAD, or a client gone before the first chunk)
+            if streaming.is_set():
+                streaming.clear()
+                os.close(read_fd)
+
+        def generate():
+            try:
+                while True:
+                    chunk = os.read(read_fd, 65536)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                close()
+
+        return generate(), close, None
 
     def record_video(self, duration, width=None, height=None, fmt=None):
-        cam = self.get_current_camera()
-        if cam is None:
+        fanout = self.get_fanout()
+        if fanout is None:
             return None, "Camera not found"
         width = int(width or self.width)
         height = int(height or self.height)
+        native_size = fanout.native_size()
         fmt = (fmt or self.format).upper()
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v') if fmt == 'MP4' else cv2.VideoWriter_fourcc(*'MJPG')
-        suffix = '.mp4' if fmt == 'MP4' else '.avi'
-        temp_filename = f"record_{int(time.time())}{suffix}"
-        out = cv2.VideoWriter(temp_filename, fourcc, 20.0, (width, height))
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            ret, frame = cam.read()
-            if not ret:
-                break
-            if frame.shape[1] != width or frame.shape[0] != height:
-                frame = cv2.resize(frame, (width, height))
-            out.write(frame)
+        if fmt == 'MP4':
+            temp_filename = os.path.join(RECORD_TMP, uuid.uuid4().hex + '.mp4')
+            out = open_mp4_writer(temp_filename, 20.0, (width, height))
+        else:
+            temp_filename = os.path.join(RECORD_TMP, uuid.uuid4().hex + '.avi')
+            out = cv2.VideoWriter(temp_filename, RECORD_FOURCC['MJPEG'], 20.0, (width, height))
+        # Decode, resize and encode on a writer thread so the capture loop only collects frames
+        frames = queue.Queue(maxsize=2)
+        errors = []
+
+        def write_frames():
+            # Keeps draining after a failure so the capture loop and the sentinel never block on a full queue
+            while True:
+                frame = frames.get()
+                if frame is None:
+                    break
+                if errors:
+                    continue
+                try:
+                    out.write(decode_resized(frame, width, height, native_size))
+                except Exception as e:
+                    # e.g. a truncated MJPG frame that imdecode cannot read
+                    errors.append(e)
+
+        writer = threading.Thread(target=write_frames, daemon=True)
+        writer.start()
+        frame_id = None
+        fanout.subscribe()
+        try:
+            start_time = time.time()
+            while time.time() - start_time < duration and not errors:
+                frame_id, frame, _ = fanout.wait_new(frame_id)
+                if frame is None:
+                    break
+                try:
+                    # Published frames are never modified, so no copy is needed
+                    frames.put_nowait(frame)
+                except queue.Full:
+                    pass  # writer is behind; drop the frame rather than stall the capture
+        finally:
+            fanout.unsubscribe()
+        try:
+            frames.put(None, timeout=FRAME_TIMEOUT)
+        except queue.Full:
+            pass
+        writer.join(FRAME_TIMEOUT)
+        if writer.is_alive():
+            # Stuck inside the encoder; releasing the writer under it could crash, so leave both to it
+            return None, "Recording failed: video writer stalled"
         out.release()
+        if errors:
+            os.remove(temp_filename)
+            return None, f"Recording failed: {errors[0]}"
         return temp_filename, None
 
 camera_manager = CameraManager()
@@ -208,11 +617,10 @@ def cam_capture():
     width = request.args.get("width", type=int)
     height = request.args.get("height", type=int)
     fmt = request.args.get("format", default=None, type=str)
-    data, err = camera_manager.capture_frame(image_format=fmt, width=width, height=height)
+    data, mimetype, err = camera_manager.capture_frame(image_format=fmt, width=width, height=height)
     if data is None:
         return jsonify({"success": False, "error": err}), 500
-    ext = 'jpg' if (fmt or camera_manager.format).upper() == 'JPEG' else 'png'
-    return Response(data, mimetype=f"image/{ext}")
+    return Response(data, mimetype=mimetype)
 
 @app.route("/cam/stream", methods=["GET"])
 def cam_stream():
@@ -222,7 +630,19 @@ def cam_stream():
     if fmt.upper() not in ['MJPEG', 'JPEG']:
         fmt = 'MJPEG'
     return Response(camera_manager.stream_generator(width=width, height=height, fmt=fmt),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+                    mimetype='multipart/x-mixed-replace; boundary=frame',
+                    direct_passthrough=True)
+
+@app.route("/cam/stream.mp4", methods=["GET"])
+def cam_stream_mp4():
+    width = request.args.get("width", type=int)
+    height = request.args.get("height", type=int)
+    stream, close, err = camera_manager.h264_stream(width=width, height=height)
+    if stream is None:
+        return jsonify({"success": False, "error": err}), 503
+    response = Response(stream, mimetype='video/mp4', direct_passthrough=True)
+    response.call_on_close(close)
+    return response
 
 @app.route("/cam/record", methods=["POST"])
 def cam_record():
@@ -234,20 +654,16 @@ def cam_record():
     filename, err = camera_manager.record_video(duration, width=width, height=height, fmt=fmt)
     if filename is None:
         return jsonify({"success": False, "error": err}), 500
-    def generate():
-        with open(filename, "rb") as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-        os.remove(filename)
     if fmt.upper() == "MP4":
         mimetype = "video/mp4"
     else:
         mimetype = "video/x-msvideo"
-    return Response(generate(), mimetype=mimetype,
-                    headers={'Content-Disposition': f'attachment; filename={os.path.basename(filename)}'})
+    # send_file hands the open file to wsgi.file_wrapper, which production servers answer with sendfile(2)
+    ext = os.path.splitext(filename)[1]
+    response = send_file(filename, mimetype=mimetype, as_attachment=True, download_name=f"record{ext}")
+    # send_file already holds the file open, so the temp file can be unlinked before the body is sent
+    os.remove(filename)
+    return response
 
 @app.route("/cam/res", methods=["PUT"])
 def cam_res():
@@ -282,5 +698,7 @@ def cam_switch():
     else:
         return jsonify({"success": False, "error": "Failed to switch camera"}), 400
 
+# For zero-copy file responses run under a WSGI server with sendfile support, e.g.
+#   gunicorn --worker-class gthread --threads 8 -b 0.0.0.0:8080 driver:app
 if __name__ == "__main__":
-    app.run(host=SERVER_HOST, port=SERVER_PORT, threaded=True)
\ No newline at end of file
+    app.run(host=SERVER_HOST, port=SERVER_PORT, threaded=True, request_handler=BufferedRequestHandler)
\ No newline at end of file
@@ -33,6 +33,7 @@ def _get_env_float(name: str, default: float = None):
 class Config:
     http_host: str
     http_port: int
+    http_write_timeout: float
     device: str
     width: int
     height: int
@@ -46,6 +47,9 @@ class Config:
 def load_config() -> Config:
     http_host = _get_env_str("HTTP_HOST", "0.0.0.0")
     http_port = _get_env_int("HTTP_PORT", 8000)
+    http_write_timeout = _get_env_float("HTTP_WRITE_TIMEOUT_SEC", 10.0)
+    if http_write_timeout is None or http_write_timeout <= 0:
+        http_write_timeout = 10.0
 
     device = _get_env_str("CAM_DEVICE", "0")
 
@@ -71,6 +75,7 @@ def load_config() -> Config:
     return Config(
         http_host=http_host,
         http_port=http_port,
+        http_write_timeout=http_write_timeout,
         device=device,
         width=width,
         height=height,
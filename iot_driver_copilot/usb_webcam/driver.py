@@ -3,6 +3,7 @@ import sys
 import time
 import threading
 import signal
+import socket
 import io
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, HTTPServer
@@ -15,11 +16,40 @@ except Exception as e:
     print(f"[FATAL] Missing dependency: {e}. Please install requirements with 'pip install -r requirements.txt'", flush=True)
     sys.exit(1)
 
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+
+# CameraWorker is the only thread touching OpenCV; its internal pool would only add wakeups
+cv2.setNumThreads(1)
+
 from config import load_config
 
+# Multipart part framing for /stream; the JPEG goes out between these without being copied
+PART_HEADER = b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+PART_TRAILER = b"\r\n"
+# socket.sendmsg is POSIX-only; elsewhere each part is joined and sent with sendall
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+def is_jpeg_buffer(frame) -> bool:
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
+
+
+_log_stamp = (None, "")
+
 
 def log(msg: str):
-    ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    # Every request is logged, so format the local time once per second rather than per line
+    global _log_stamp
+    sec = int(time.time())
+    cached_sec, ts = _log_stamp
+    if sec != cached_sec:
+        ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec))
+        _log_stamp = (sec, ts)
     print(f"[{ts}] {msg}", flush=True)
 
 
@@ -27,27 +57,33 @@ class FrameBuffer:
     def __init__(self):
         self._lock = threading.Lock()
         self._cond = threading.Condition(self._lock)
-        self._frame = None  # bytes (JPEG)
+        self._frame = None  # memoryview over the JPEG bytes
         self._ts = 0.0
+        self.viewers = 0  # open streams and /frame requests; frames are only decoded while there are any
 
-    def set_frame(self, data: bytes, ts: float):
+    def set_frame(self, data: memoryview, ts: float):
         with self._cond:
             self._frame = data
             self._ts = ts
             self._cond.notify_all()
 
-    def get_latest(self, timeout: float):
-        deadline = time.time() + timeout if timeout is not None and timeout > 0 else None
+    def subscribe(self):
         with self._cond:
-            while self._frame is None:
-                if deadline is not None:
-                    remaining = deadline - time.time()
-                    if remaining <= 0:
-                        return None, 0.0
-                    self._cond.wait(remaining)
-                else:
-                    self._cond.wait()
-            return self._frame, self._ts
+            self.viewers += 1
+
+    def unsubscribe(self):
+        with self._cond:
+            self.viewers -= 1
+
+    def get_next(self, timeout: float):
+        # The stored frame goes stale while nobody watches, so wait for the next one
+        with self._cond:
+            after_ts = self._ts
+            self.viewers += 1
+        try:
+            return self.wait_for_next(after_ts, timeout)
+        finally:
+            self.unsubscribe()
 
     def wait_for_next(self, after_ts: float, timeout: float):
         deadline = time.time() + timeout if timeout is not None and timeout > 0 else None
@@ -93,6 +129,12 @@ class CameraWorker(threading.Thread):
         return cap
 
     def _configure_capture(self, cap):
+        # Ask for MJPG on the wire before sizing (UVC modes are per pixel format) and keep it
+        # compressed, so frames are forwarded without a decode/re-encode round trip
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        if int(cap.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG'):
+            # Only a camera that agreed to MJPG hands back JPEG bytes; others still need converting
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         # Apply requested properties if provided
         if self.cfg.width:
             cap.set(cv2.CAP_PROP_FRAME_WIDTH, int(self.cfg.width))
@@ -114,6 +156,20 @@ class CameraWorker(threading.Thread):
             actual_fps = 0.0
         log(f"[camera] Opened device with resolution {actual_w}x{actual_h} @ {actual_fps:.2f}fps")
 
+    def _encode_jpeg(self, frame) -> memoryview:
+        # Sockets take any buffer, so the capture/encoder arrays are published as flat byte views
+        # instead of being copied into bytes; retrieve() hands back a fresh array every frame
+        if is_jpeg_buffer(frame):
+            return memoryview(frame).cast('B')
+        quality = int(self.cfg.jpeg_quality)
+        if turbo_jpeg is not None:
+            # libjpeg-turbo's SIMD encoder takes the BGR frame directly
+            return memoryview(turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420))
+        ok, jpg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if not ok:
+            raise RuntimeError("cv2.imencode returned False")
+        return memoryview(jpg).cast('B')
+
     def _release(self):
         try:
             if self._cap is not None:
@@ -136,17 +192,19 @@ class CameraWorker(threading.Thread):
 
                 last_log = 0.0
                 while not self.stop_event.is_set():
-                    ok, frame = self._cap.read()
+                    # grab() dequeues the frame and keeps the device paced; decoding it is left to
+                    # retrieve(), which is skipped while nobody is watching
+                    if not self._cap.grab():
+                        raise RuntimeError("Failed to read frame from camera")
+                    if not self.buffer.viewers:
+                        continue
+                    ok, frame = self._cap.retrieve()
                     if not ok or frame is None:
                         raise RuntimeError("Failed to read frame from camera")
                     ts = time.time()
                     # Encode JPEG
                     try:
-                        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(self.cfg.jpeg_quality)]
-                        ok, jpg = cv2.imencode('.jpg', frame, params)
-                        if not ok:
-                            raise RuntimeError("cv2.imencode returned False")
-                        self.buffer.set_frame(jpg.tobytes(), ts)
+                        self.buffer.set_frame(self._encode_jpeg(frame), ts)
                     except Exception as e:
                         log(f"[camera] JPEG encode error: {e}")
                         # Continue reading; if persistent, read loop may break on timeout logic
@@ -191,7 +249,7 @@ class MJPEGHandler(BaseHTTPRequestHandler):
             self.send_error(HTTPStatus.NOT_FOUND, "Not Found")
 
     def handle_frame(self):
-        data, ts = self.buffer.get_latest(timeout=self.cfg.read_timeout)
+        data, ts = self.buffer.get_next(timeout=self.cfg.read_timeout)
         if data is None:
             self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "No frame available")
             return
@@ -208,15 +266,21 @@ class MJPEGHandler(BaseHTTPRequestHandler):
             log(f"[http] /frame error: {e}")
 
     def handle_stream(self):
-        boundary = "frame"
+        self.buffer.subscribe()
+        try:
+            self._stream()
+        finally:
+            self.buffer.unsubscribe()
+
+    def _stream(self):
         # Ensure we have at least one frame available to start
-        data, ts = self.buffer.get_latest(timeout=self.cfg.read_timeout)
+        data, ts = self.buffer.get_next(timeout=self.cfg.read_timeout)
         if data is None:
             self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "No frame available to start stream")
             return
         try:
             self.send_response(HTTPStatus.OK)
-            self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={boundary}")
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
             self.send_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
             self.end_headers()
         except Exception as e:
@@ -226,8 +290,7 @@ class MJPEGHandler(BaseHTTPRequestHandler):
         last_ts = 0.0
         # Write initial frame immediately
         try:
-            part = self._mjpeg_part(boundary, data)
-            self.wfile.write(part)
+            self._send_part(data)
             last_ts = ts
         except BrokenPipeError:
             return
@@ -241,8 +304,7 @@ class MJPEGHandler(BaseHTTPRequestHandler):
                 if data is None:
                     # No new frame within timeout, end stream so client can reconnect
                     break
-                part = self._mjpeg_part(boundary, data)
-                self.wfile.write(part)
+                self._send_part(data)
                 last_ts = ts
             except BrokenPipeError:
                 break
@@ -250,14 +312,20 @@ class MJPEGHandler(BaseHTTPRequestHandler):
                 log(f"[http] /stream write error: {e}")
                 break
 
-    def _mjpeg_part(self, boundary: str, data: bytes) -> bytes:
-        headers = (
-            f"--{boundary}\r\n"
-            f"Content-Type: image/jpeg\r\n"
-            f"Content-Length: {len(data)}\r\n\r\n"
-        ).encode('ascii')
-        trailer = b"\r\n"
-        return headers + data + trailer
+    def _send_part(self, data: memoryview):
+        # Scatter-gather write: header, JPEG and trailer leave in one syscall without concatenation
+        parts = (PART_HEADER % len(data), data, PART_TRAILER)
+        if not HAS_SENDMSG:
+            self.connection.sendall(b"".join(parts))
+            return
+        sent = self.connection.sendmsg(parts)
+        for buf in parts:
+            if sent >= len(buf):
+                sent -= len(buf)
+                continue
+            # Short write (full socket buffer): push the rest of this buffer and the ones after it
+            self.connection.sendall(memoryview(buf)[sent:])
+            sent = 0
 
     def log_message(self, format, *args):
         # Keep default logging concise
@@ -296,6 +364,9 @@ def main():
     handler_cls.buffer = buffer
     handler_cls.cfg = cfg
     handler_cls.stop_event = stop_event
+    # Viewers only ever get the newest frame, so a slow client skips frames rather than queueing them;
+    # a client that stops reading entirely times out and frees its thread
+    handler_cls.timeout = cfg.http_write_timeout
 
     httpd = ThreadedHTTPServer((cfg.http_host, cfg.http_port), handler_cls)
 
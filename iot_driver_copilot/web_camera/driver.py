@@ -1,12 +1,41 @@
 import os
+import sys
+import asyncio
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
-import io
-from flask import Flask, Response, request, jsonify, send_file
-from werkzeug.utils import secure_filename
+from aiohttp import web, WSCloseCode
 
-app = Flask(__name__)
+# Preferred JPEG encoder: auto tries nvjpeg, then turbo, then cv2; naming one skips those before it
+JPEG_ENCODER = os.environ.get("JPEG_ENCODER", "auto").lower()
+nv_jpeg = None
+if JPEG_ENCODER in ("auto", "nvjpeg"):
+    try:
+        from nvjpeg import NvJpeg
+        nv_jpeg = NvJpeg()
+    except (ImportError, OSError, RuntimeError):
+        nv_jpeg = None  # no CUDA device or nvjpeg bindings; encode on the CPU
+# The broker and the capture workers may encode at the same time; one encoder state is shared on the GPU
+nv_jpeg_lock = threading.Lock()
+turbo_jpeg = None
+if JPEG_ENCODER != "cv2":
+    try:
+        from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420, TJFLAG_FASTDCT
+        turbo_jpeg = TurboJPEG()
+    except (ImportError, OSError, RuntimeError):
+        turbo_jpeg = None  # libturbojpeg not available; fall back to cv2.imencode
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # the default asyncio loop works, just with more per-write overhead
+try:
+    from pyspng import encode as spng_encode  # pyspng-seunglab; the original pyspng only decodes
+except ImportError:
+    spng_encode = None  # fall back to cv2.imencode
+
+# Frames are read and encoded on one broker thread per camera; OpenCV's own pool would only add handoffs
+cv2.setNumThreads(1)
 
 # Configuration from environment variables
 HTTP_HOST = os.environ.get("HTTP_HOST", "0.0.0.0")
@@ -17,6 +46,62 @@ DEFAULT_CAMERA_ID = int(os.environ.get("DEFAULT_CAMERA_ID", "0"))
 DEFAULT_RESOLUTION = os.environ.get("DEFAULT_RESOLUTION", "640x480")
 DEFAULT_FRAME_RATE = int(os.environ.get("DEFAULT_FRAME_RATE", "30"))
 DEFAULT_FORMAT = os.environ.get("DEFAULT_FORMAT", "jpg")
+FRAME_TIMEOUT = float(os.environ.get("FRAME_TIMEOUT", "5"))
+# Capture encodes release the GIL inside OpenCV/libjpeg-turbo, so one worker per core runs them in parallel
+ENCODE_WORKERS = int(os.environ.get("ENCODE_WORKERS", str(os.cpu_count() or 1)))
+STREAM_JPEG_QUALITY = int(os.environ.get("STREAM_JPEG_QUALITY", "70"))
+PART_PREFIX = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+PART_MID = b'\r\n\r\n'
+PART_TAIL = b'\r\n'
+# Prefer V4L2 on Linux so pixel format requests reach the driver
+CAPTURE_BACKEND = cv2.CAP_V4L2 if sys.platform.startswith("linux") else cv2.CAP_ANY
+# Captures are one-shot, so favour latency: fastest zlib level with run-length matching
+PNG_PARAMS = [int(cv2.IMWRITE_PNG_COMPRESSION), 1, int(cv2.IMWRITE_PNG_STRATEGY), cv2.IMWRITE_PNG_STRATEGY_RLE]
+# Live viewers care about latency, not bytes: baseline 4:2:0 with no extra Huffman optimisation pass
+STREAM_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), STREAM_JPEG_QUALITY,
+                      int(cv2.IMWRITE_JPEG_OPTIMIZE), 0, int(cv2.IMWRITE_JPEG_PROGRESSIVE), 0]
+
+def encode_jpeg(frame, quality=90):
+    if nv_jpeg is not None:
+        # nvJPEG takes the BGR frame as-is and runs DCT and Huffman coding on the GPU
+        with nv_jpeg_lock:
+            return nv_jpeg.encode(frame, quality)
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ret:
+        return None
+    return buf.tobytes()
+
+def encode_stream_jpeg(frame):
+    # Stream parts go straight to the socket, so the cv2 result is returned as a view, not copied to bytes
+    if nv_jpeg is not None:
+        with nv_jpeg_lock:
+            return nv_jpeg.encode(frame, STREAM_JPEG_QUALITY)
+    if turbo_jpeg is not None:
+        # The integer fast DCT is noticeably quicker and its error is invisible at stream quality
+        return turbo_jpeg.encode(frame, quality=STREAM_JPEG_QUALITY, pixel_format=TJPF_BGR,
+                                 jpeg_subsample=TJSAMP_420, flags=TJFLAG_FASTDCT)
+    ret, buf = cv2.imencode('.jpg', frame, STREAM_JPEG_PARAMS)
+    if not ret:
+        return None
+    return memoryview(buf).cast('B')
+
+def encode_png(frame):
+    if spng_encode is not None:
+        # libspng's SIMD filters and CRC outrun libpng at the same level; it takes RGB order
+        return spng_encode(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), compress_level=1)
+    ret, buf = cv2.imencode('.png', frame, PNG_PARAMS)
+    return buf.tobytes() if ret else None
+
+def is_jpeg_buffer(frame):
+    # With CAP_PROP_CONVERT_RGB off, the V4L2 backend returns the raw MJPG payload as a 1-D byte array
+    return frame.ndim < 3 and frame.size > 2 and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8
+
+def decode_frame(frame):
+    if is_jpeg_buffer(frame):
+        return cv2.imdecode(frame, cv2.IMREAD_COLOR)
+    return frame
 
 def parse_resolution(res_str):
     try:
@@ -25,18 +110,101 @@ def parse_resolution(res_str):
     except Exception:
         return 640, 480
 
+# One producer thread per camera reads and encodes each frame once; every viewer shares the JPEG.
+# Viewers are coroutines on the server's event loop, so N streams cost N tasks rather than N threads
+class FrameBroker:
+    def __init__(self, cap, loop):
+        self.cap = cap
+        self.loop = loop
+        # Replaced on every frame; the old event is set to wake all viewers waiting on it
+        self.frame_ready = asyncio.Event()
+        # (frame_id, frame, jpeg) swapped as one reference so readers never see a torn frame
+        self.latest = (0, None, None)
+        # Open streams and captures waiting for a frame; only touched on the event loop
+        self.consumers = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.loop.call_soon_threadsafe(self._notify)
+        if self.thread is not None:
+            self.thread.join(FRAME_TIMEOUT)
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            if not self.cap.grab():
+                break
+            # Nobody is waiting for this frame: leave it undecoded and unencoded
+            if not self.consumers:
+                continue
+            ret, frame = self.cap.retrieve()
+            if not ret or frame is None:
+                break
+            # MJPG passthrough frames are already JPEG; only raw frames need encoding. retrieve() returns
+            # a fresh array per frame, so viewers can write straight from it while it stays published
+            jpeg = memoryview(frame).cast('B') if is_jpeg_buffer(frame) else encode_stream_jpeg(frame)
+            if jpeg is None:
+                continue
+            self.latest = (self.latest[0] + 1, frame, jpeg)
+            self.loop.call_soon_threadsafe(self._notify)
+        self.running = False
+        self.loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self):
+        # Runs on the event loop thread, so swapping the event cannot race a viewer picking it up
+        event, self.frame_ready = self.frame_ready, asyncio.Event()
+        event.set()
+
+    async def wait_for_frame(self, last_id=0):
+        # Returns (frame_id, frame, jpeg) for the first frame newer than last_id
+        event = self.frame_ready
+        latest = self.latest
+        if latest[0] == last_id and self.running:
+            # Only a viewer that has caught up with the producer has to wait
+            try:
+                await asyncio.wait_for(event.wait(), FRAME_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            latest = self.latest
+        if not self.running or latest[0] == last_id:
+            return last_id, None, None
+        return latest
+
+def encode_capture(frame, fmt):
+    # Returns (bytes, file_ext); anything other than png is sent as jpeg
+    if fmt.lower() == 'png':
+        return encode_png(decode_frame(frame)), 'png'
+    if is_jpeg_buffer(frame):
+        return frame.tobytes(), 'jpg'
+    return encode_jpeg(frame, 90), 'jpg'
+
+encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+
 class CameraManager:
     def __init__(self):
         self.cameras = {}
         self.locks = {}
+        self.loop = None  # the server's event loop, set on startup
 
     def start_camera(self, camera_id=DEFAULT_CAMERA_ID, resolution=None, frame_rate=None, format_=None):
         camera_id = int(camera_id)
         if camera_id in self.cameras:
             return {"status": "already started"}
-        cap = cv2.VideoCapture(camera_id)
+        cap = cv2.VideoCapture(camera_id, CAPTURE_BACKEND)
         if not cap.isOpened():
             return {"error": f"Cannot open camera {camera_id}"}
+        # Ask for MJPG on the wire and keep it compressed so streams forward the camera's JPEG as-is
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        if int(cap.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG'):
+            # Only a camera that agreed to MJPG hands back JPEG bytes; others still need converting
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         # Set resolution
         if resolution:
             width, height = resolution
@@ -47,9 +215,16 @@ class CameraManager:
         # Set frame rate if provided
         if frame_rate:
             cap.set(cv2.CAP_PROP_FPS, int(frame_rate))
+        # Keep a single queued frame so a slow consumer gets the newest image, not a backlog
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        broker = FrameBroker(cap, self.loop)
+        broker.start()
         self.cameras[camera_id] = {
             "cap": cap,
+            "broker": broker,
             "resolution": (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+            # What was asked for; the camera may have settled on a different size
+            "requested_resolution": (width, height),
             "frame_rate": int(cap.get(cv2.CAP_PROP_FPS)),
             "format": format_ or DEFAULT_FORMAT
         }
@@ -61,80 +236,96 @@ class CameraManager:
         if camera_id not in self.cameras:
             return {"error": f"Camera {camera_id} is not started"}
         with self.locks[camera_id]:
+            self.cameras[camera_id]["broker"].stop()
             self.cameras[camera_id]["cap"].release()
             del self.cameras[camera_id]
             del self.locks[camera_id]
         return {"status": "stopped", "camera_id": camera_id}
 
+    def restart_camera(self, camera_id, resolution):
+        # A new size means reopening the device: the broker thread owns the capture while it runs
+        cam_info = self.cameras.get(camera_id)
+        if cam_info is not None:
+            if cam_info["requested_resolution"] == tuple(resolution):
+                return {"status": "already started"}
+            self.stop_camera(camera_id)
+            return self.start_camera(camera_id, resolution, cam_info["frame_rate"], cam_info["format"])
+        return self.start_camera(camera_id, resolution)
+
     def get_camera(self, camera_id=DEFAULT_CAMERA_ID):
         camera_id = int(camera_id)
         return self.cameras.get(camera_id, None)
 
-    def capture_frame(self, camera_id=DEFAULT_CAMERA_ID, resolution=None, format_=None):
+    async def capture_frame(self, camera_id=DEFAULT_CAMERA_ID, resolution=None, format_=None):
         camera_id = int(camera_id)
         if camera_id not in self.cameras:
-            start_result = self.start_camera(camera_id, resolution, None, format_)
+            # Opening a device blocks for a while; keep it off the loop that serves the streams
+            start_result = await self.loop.run_in_executor(None, self.start_camera, camera_id, resolution, None, format_)
+            if "error" in start_result:
+                return None, start_result["error"], None
+        elif resolution and self.cameras[camera_id]["requested_resolution"] != tuple(resolution):
+            # Streams on this camera end and reconnect at the new size
+            start_result = await self.loop.run_in_executor(None, self.restart_camera, camera_id, resolution)
             if "error" in start_result:
                 return None, start_result["error"], None
         cam_info = self.cameras[camera_id]
-        cap = cam_info["cap"]
         fmt = format_ or cam_info.get("format", DEFAULT_FORMAT)
-        if resolution:
-            width, height = resolution
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-        with self.locks[camera_id]:
-            ret, frame = cap.read()
-        if not ret or frame is None:
+        broker = cam_info["broker"]
+        # The published frame is stale if nobody was consuming, so always wait for the next one
+        broker.consumers += 1
+        try:
+            _, frame, _ = await broker.wait_for_frame(broker.latest[0])
+        finally:
+            broker.consumers -= 1
+        if frame is None:
             return None, f"Failed to capture frame from camera {camera_id}", None
-        # Encode frame
-        encode_param = []
-        file_ext = fmt.lower()
-        if file_ext == 'jpg' or file_ext == 'jpeg':
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
-            file_ext = 'jpg'
-        elif file_ext == 'png':
-            encode_param = [int(cv2.IMWRITE_PNG_COMPRESSION), 3]
-            file_ext = 'png'
-        else:
-            # Default to jpeg
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
-            file_ext = 'jpg'
-        ret, buf = cv2.imencode(f'.{file_ext}', frame, encode_param)
-        if not ret:
+        # Encoding holds the CPU for milliseconds; run it on the encode pool so streams keep flowing and
+        # captures never queue behind device opens or stops in the default executor
+        data, file_ext = await self.loop.run_in_executor(encode_pool, encode_capture, frame, fmt)
+        if data is None:
             return None, "Encoding frame failed", None
-        return buf.tobytes(), None, file_ext
+        return data, None, file_ext
 
-    def generate_mjpeg(self, camera_id=DEFAULT_CAMERA_ID):
+    async def get_broker(self, camera_id=DEFAULT_CAMERA_ID):
+        # Returns (broker, error), starting the camera on first use
         camera_id = int(camera_id)
         if camera_id not in self.cameras:
-            start_result = self.start_camera(camera_id)
+            start_result = await self.loop.run_in_executor(None, self.start_camera, camera_id)
             if "error" in start_result:
-                yield f"--frame\r\nContent-Type: text/plain\r\n\r\n{start_result['error']}\r\n"
-                return
-        cam_info = self.cameras[camera_id]
-        cap = cam_info["cap"]
-        width, height = cam_info.get("resolution", (640,480))
-        fmt = cam_info.get("format", DEFAULT_FORMAT)
-        while True:
-            with self.locks[camera_id]:
-                ret, frame = cap.read()
-            if not ret or frame is None:
-                break
-            ret, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            if not ret:
-                continue
-            frame_bytes = buf.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            # Try to control FPS
-            time.sleep(1.0 / (cam_info.get("frame_rate", DEFAULT_FRAME_RATE) or 30))
+                return None, start_result["error"]
+        return self.cameras[camera_id]["broker"], None
+
+    async def generate_mjpeg(self, camera_id=DEFAULT_CAMERA_ID):
+        broker, error = await self.get_broker(camera_id)
+        if error:
+            yield f"--frame\r\nContent-Type: text/plain\r\n\r\n{error}\r\n".encode()
+            return
+        frame_id = 0
+        part_sep = b''
+        broker.consumers += 1
+        try:
+            while True:
+                # Wait for the producer's next frame; the JPEG was encoded once for all viewers
+                frame_id, _, frame_bytes = await broker.wait_for_frame(frame_id)
+                if frame_bytes is None:
+                    break
+                # Yield the shared JPEG as its own chunk instead of copying it into a concatenated part
+                yield part_sep + PART_PREFIX + b'%d' % len(frame_bytes) + PART_MID
+                yield frame_bytes
+                part_sep = PART_TAIL
+        finally:
+            broker.consumers -= 1
 
 camera_manager = CameraManager()
+routes = web.RouteTableDef()
 
-@app.route('/camera/start', methods=['POST'])
-def start_camera():
-    params = request.get_json(silent=True) or {}
+@routes.post('/camera/start')
+async def start_camera(request):
+    try:
+        params = await request.json()
+    except Exception:
+        params = {}
+    params = params or {}
     camera_id = params.get("camera_id", DEFAULT_CAMERA_ID)
     res = params.get("resolution")
     if res:
@@ -148,50 +339,89 @@ def start_camera():
         resolution = parse_resolution(DEFAULT_RESOLUTION)
     frame_rate = params.get("frame_rate", DEFAULT_FRAME_RATE)
     format_ = params.get("format", DEFAULT_FORMAT)
-    result = camera_manager.start_camera(camera_id, resolution, frame_rate, format_)
+    result = await camera_manager.loop.run_in_executor(
+        None, camera_manager.start_camera, camera_id, resolution, frame_rate, format_)
     if "error" in result:
-        return jsonify(result), 400
-    return jsonify(result)
+        return web.json_response(result, status=400)
+    return web.json_response(result)
 
-@app.route('/camera/stop', methods=['POST'])
-def stop_camera():
-    params = request.get_json(silent=True) or {}
+@routes.post('/camera/stop')
+async def stop_camera(request):
+    try:
+        params = await request.json()
+    except Exception:
+        params = {}
+    params = params or {}
     camera_id = params.get("camera_id", DEFAULT_CAMERA_ID)
-    result = camera_manager.stop_camera(camera_id)
+    # Stopping joins the producer thread; wait for it on a worker, not on the loop
+    result = await camera_manager.loop.run_in_executor(None, camera_manager.stop_camera, camera_id)
     if "error" in result:
-        return jsonify(result), 400
-    return jsonify(result)
-
-@app.route('/camera/capture', methods=['GET'])
-def capture_frame():
-    camera_id = request.args.get("camera_id", DEFAULT_CAMERA_ID)
-    res = request.args.get("resolution")
-    fmt = request.args.get("format", DEFAULT_FORMAT)
-    if res:
-        resolution = parse_resolution(res)
-    else:
-        resolution = parse_resolution(DEFAULT_RESOLUTION)
-    frame_bytes, error, file_ext = camera_manager.capture_frame(camera_id, resolution, fmt)
+        return web.json_response(result, status=400)
+    return web.json_response(result)
+
+@routes.get('/camera/capture')
+async def capture_frame(request):
+    camera_id = int(request.query.get("camera_id", DEFAULT_CAMERA_ID))
+    res = request.query.get("resolution")
+    fmt = request.query.get("format", DEFAULT_FORMAT)
+    # Without a resolution the capture uses the camera's current size
+    resolution = parse_resolution(res) if res else None
+    frame_bytes, error, file_ext = await camera_manager.capture_frame(camera_id, resolution, fmt)
+    if error:
+        return web.json_response({"error": error}, status=400)
+    filename = f"camera_{camera_id}_{int(time.time())}.{file_ext}"
+    return web.Response(body=frame_bytes, content_type=f'image/{file_ext}', headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    })
+
+@routes.get('/camera/stream')
+async def stream_camera(request):
+    camera_id = request.query.get("camera_id", DEFAULT_CAMERA_ID)
+    response = web.StreamResponse(headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame"})
+    await response.prepare(request)
+    # Each write waits only for this viewer's socket; a slow client never blocks the others
+    parts = camera_manager.generate_mjpeg(camera_id)
+    try:
+        async for chunk in parts:
+            await response.write(chunk)
+    finally:
+        # Close now rather than at garbage collection so a disconnected viewer stops counting as a consumer
+        await parts.aclose()
+    return response
+
+async def drain_ws(ws):
+    async for _ in ws:
+        pass
+
+@routes.get('/camera/ws')
+async def stream_camera_ws(request):
+    # Same frames as /camera/stream, one binary message per JPEG: no multipart boundaries for the client
+    # to parse and one write per frame
+    camera_id = request.query.get("camera_id", DEFAULT_CAMERA_ID)
+    broker, error = await camera_manager.get_broker(camera_id)
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
     if error:
-        return jsonify({"error": error}), 400
-    filename = secure_filename(f"camera_{camera_id}_{int(time.time())}.{file_ext}")
-    return send_file(
-        io.BytesIO(frame_bytes),
-        mimetype=f'image/{file_ext}',
-        as_attachment=True,
-        download_name=filename
-    )
-
-@app.route('/camera/stream', methods=['GET'])
-def stream_camera():
-    camera_id = request.args.get("camera_id", DEFAULT_CAMERA_ID)
-    def generate():
-        yield from camera_manager.generate_mjpeg(camera_id)
-    return Response(generate(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
-
-@app.route('/camera/status', methods=['GET'])
-def camera_status():
+        await ws.close(code=WSCloseCode.INTERNAL_ERROR, message=error.encode())
+        return ws
+    # Viewers send nothing, but something has to read so close frames and pings get answered
+    reader = asyncio.ensure_future(drain_ws(ws))
+    frame_id = 0
+    broker.consumers += 1
+    try:
+        while not ws.closed:
+            frame_id, _, frame_bytes = await broker.wait_for_frame(frame_id)
+            if frame_bytes is None:
+                break
+            await ws.send_bytes(frame_bytes)
+    finally:
+        broker.consumers -= 1
+        reader.cancel()
+    await ws.close()
+    return ws
+
+@routes.get('/camera/status')
+async def camera_status(request):
     status = {
         "cameras": [
             {
@@ -202,7 +432,21 @@ def camera_status():
             } for cam_id, cam_info in camera_manager.cameras.items()
         ]
     }
-    return jsonify(status)
+    return web.json_response(status)
+
+async def bind_loop(app):
+    camera_manager.loop = asyncio.get_running_loop()
+
+async def stop_cameras(app):
+    for camera_id in list(camera_manager.cameras):
+        await camera_manager.loop.run_in_executor(None, camera_manager.stop_camera, camera_id)
+
+app = web.Application()
+app.add_routes(routes)
+app.on_startup.append(bind_loop)
+app.on_cleanup.append(stop_cameras)
 
 if __name__ == "__main__":
-    app.run(host=HTTP_HOST, port=HTTP_PORT, threaded=True)
\ No newline at end of file
+    if uvloop is not None:
+        uvloop.install()
+    web.run_app(app, host=HTTP_HOST, port=HTTP_PORT)